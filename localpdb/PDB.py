@@ -1,21 +1,41 @@
 import os
+import contextlib
 import importlib
 import tarfile
 import warnings
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from localpdb import PDBVersioneer
-from localpdb.utils.prot import parse_pdb_data
-from localpdb.utils.os import parse_simple, custom_warning
+from localpdb.PDBVersioneer import PDBVersioneer
+from localpdb.PDBVersions import PDBVersions
+from localpdb.utils.snapshot import load_pdb_data, load_sequence_arena, load_kmer_index, SNAPSHOT_FN, \
+    SNAPSHOT_INFO_FN, SEQRES_FN, SEQRES_IDX_FN, SEQRES_ARENA_FN, SEQRES_KMER_FN, SEQRES_KMER_IDX_FN
+from localpdb.utils.os import parse_simple, custom_warning, prefetch_map, read_gz, map_chunks
+from localpdb.utils.mirror import load_manifest
+from localpdb.utils.selection import EntryChainMap, SortedIndex
+from localpdb.utils.motif import scan_motifs
+from localpdb.utils.similarity import align_candidates
 from localpdb.utils.config import Config
-from localpdb.utils.rest_api import CommandFactory
+from localpdb.utils.cache import METADATA_CACHE_FN
 
 warnings.showwarning = custom_warning
 
+
+def _copy_on_write():
+    """
+    @return: True if the pandas Copy-on-Write mode is enabled (always in pandas >= 3) - a shallow copy of a DataFrame
+    can then be modified without changing the original DataFrame
+    """
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
 class PDB:
 
-    def __init__(self, db_path='', version='latest', plugins=[], auto_filter=True):
+    # Columns of lpdb.chains holding the entry-level data (stored as references to lpdb.entries in the compact mode)
+    _entry_level_cols = ['deposition_date', 'resolution', 'method']
+
+    def __init__(self, db_path='', version='latest', plugins=[], auto_filter=True, lazy_sequences=False,
+                 compact=False):
         """
         @param db_path (str): location of the localpdb database
         @param version (int) or 'latest': version of the localpdb database to load (default: version='latest')
@@ -23,15 +43,27 @@ class PDB:
         @param auto_filter (bool): automatically propagate selections performed on any of the DataFrames
         to other DataFrames
         (default: auto_filter=True)
+        @param lazy_sequences (bool): do not load the 'sequence' column of lpdb.chains, sequences are fetched on demand
+        with the get_sequences() or load_sequences() methods (default: lazy_sequences=False)
+        @param compact (bool): use memory efficient layout of the DataFrames - categorical dtypes for the low
+        cardinality and identifier columns, entry-level columns of lpdb.chains are joined from lpdb.entries on access
+        (default: compact=False)
         """
 
         self.db_path = Path(os.path.realpath(db_path)) # Absolute db path
         self.auto_filter = auto_filter # Flag to set auto-filtering feature
+        self.lazy_sequences = lazy_sequences # Flag to keep sequences out of the lpdb.chains
+        self.compact = compact # Flag to use the compact memory layout
+        self._arena = None # Integer-encoded sequences, loaded on demand
+        self._kmer_index = None # K-mer index of the sequences, loaded on demand
+        self.__rest_api_commands = None # Search API command factory, created on the first search
         self._pdbv = PDBVersioneer(db_path=db_path) # Versioning system
         self._loaded_plugins = []  # List of loaded plugins
         self._loaded_plugins_handles = []  # Handles to loaded plugins for reset function
         self.__registered_attrs = []  # Attributes handled by plugins
         self.__lock = False  # Lock flag used with auto-filtering to avoid recursive filtering
+        self.__batch_depth = 0  # Depth of the nested batch() blocks, auto-filtering is deferred inside them
+        self.__pending = []  # DataFrames and attributes changed inside the batch() block
 
         # Check with PDBVersioneer whether any versions are installed in the db_path
         if len(self._pdbv.local_pdb_versions) == 0 and self._pdbv.current_local_version is None:
@@ -66,35 +98,66 @@ class PDB:
                     self.version))
         self.bundles = parse_simple(self._pdb_bundles_fn)
 
-        # Create dataframes with per-structure and per-chain data
-        self.__entries, self.__chains = parse_pdb_data(self._pdb_entries_fn, self._pdb_entries_type_fn,
-                                                       self._pdb_res_fn, self._pdb_seqres_fn)
+        # Create dataframes with per-structure and per-chain data (loaded from the snapshot if it is up to date)
+        # These are the base DataFrames - selections are stored as positions of the selected rows in the base
+        # DataFrames and lpdb.entries and lpdb.chains are materialized on access (see __entries and __chains)
+        self.__entries_base, self.__chains_base, self._seqres = load_pdb_data(self._working_path,
+                                                                              lazy_sequences=self.lazy_sequences)
+        self.__entries_pos, self.__chains_pos = None, None  # Positions of the selected rows (None - all rows)
+        self.__entries_cache, self.__chains_cache = None, None  # Materialized selections
+        self.__chains_joined = None  # lpdb.chains with the joined entry-level columns (compact mode, see chains)
+        self.__range_indexes = {}  # Sorted indexes of the base DataFrames columns, built on demand (see select_range)
+        self.__inverse_pos = {}  # Rows of the current selections for each row of the base DataFrames (see select_range)
 
         # Basic check for corrupt files
-        if self.__entries.shape[1] not in [3, 4]: # Backwards compatibility with ver 0.1
+        if self.__entries_base.shape[1] not in [3, 4]: # Backwards compatibility with ver 0.1
             raise ValueError(
                 f'PDB raw files for version \'{self.version}\' are corrupt! Try rerunning setup or update scripts!')
 
         # Set according filenames pointing to the structures
-        id_dict = {id_: id_ for id_ in self.__entries.index.values}
+        pdb_ids = self.__entries_base.index
         if self.__config['struct_mirror']['pdb'] and self.__config['struct_mirror']['pdb_init_ver'] <= self.version:
-            self._set_filenames(id_dict, format='pdb')
+            self._set_filenames(pdb_ids, format='pdb')
         if self.__config['struct_mirror']['cif'] and self.__config['struct_mirror']['cif_init_ver'] <= self.version:
-            self._set_filenames(id_dict, format='mmCIF')
+            self._set_filenames(pdb_ids, format='mmCIF')
+
+        if self.compact:
+            self.__set_compact_layout()
 
-        # Keep copy of dataframes to allow for reseting the selections
-        self.__entries_copy = self.__entries.copy()
-        self.__chains_copy = self.__chains.copy()
+        # Integer mapping between the entries and chains used to propagate the selections
+        self.__map = EntryChainMap(self.__entries_base.index, self.__chains_base['pdb'])
+
+        # Columns of the base DataFrames, columns added later by the plugins are removed on reset
+        self.__base_cols = (self.__entries_base.columns, self.__chains_base.columns)
 
         # Workaround to run setters only once
         self.chains = self.__chains
         self.entries == self.__entries
-        self.__rest_api_commands = CommandFactory()
 
         # Load plugins if any
         for plugin in plugins:
             self.load_plugin(plugin)
 
+    @staticmethod
+    def load_versions(db_path='', versions=None):
+        """
+        Loads multiple localpdb versions sharing the rows that did not change between them (see PDBVersions)
+        @param db_path (str): location of the localpdb database
+        @param versions (list): versions of the localpdb database to load (default: None - all installed versions)
+        @return: PDBVersions
+        """
+        return PDBVersions(db_path=db_path, versions=versions)
+
+    @property
+    def _rest_api_commands(self):
+        """
+        Search API command factory, created on the first search (imports the search API and network dependencies)
+        """
+        if self.__rest_api_commands is None:
+            from localpdb.utils.rest_api import CommandFactory
+            self.__rest_api_commands = CommandFactory()
+        return self.__rest_api_commands
+
     def __setattr__(self, item, value):
         """
         This is a setattr hook that allows for the auto-filtering option. Whenever and attribute registered in
@@ -105,41 +168,50 @@ class PDB:
             if self.auto_filter:
                 # Item must be in __registered_attrs and lpdb must have this attribute prior to auto-filtering
                 if item in self.__registered_attrs and hasattr(self, item):
-                    # Current pdb and pdb_chain indexes from lpdb.structures and lpdb.chains
-                    pdb_ids, pdb_chain_ids = self._get_current_indexes()
-                    # Now fetching pdb and pdb_chain ids from the plugin (it may not have certain columns so try/except)
-                    try:
-                        plugin_pdb_ids = set(value['pdb'])
-                    except KeyError:
-                        plugin_pdb_ids = set()
-                    try:
-                        plugin_pdb_chain_ids = set(value['pdb_chain'])
-                    except KeyError:
-                        plugin_pdb_chain_ids = set()
-
-                    # Keep only pdb_ids that were in the lpdb.entries or lpdb.chains and are in the plugin
-                    valid_pdb_ids = pdb_ids & plugin_pdb_ids
-                    valid_pdb_chain_ids = pdb_chain_ids & plugin_pdb_chain_ids
-
-                    # Update attributes donated by other plugins. Use self.__dict__ method to bypass the setattr hook
-                    if not self.__lock:
-                        for _attr in [el for el in self.__registered_attrs if el != item]:
-                            try:
-                                self.__dict__[_attr] = self.__dict__[_attr][
-                                    self.__dict__[_attr]['pdb_chain'].isin(valid_pdb_chain_ids)]
-                            except KeyError:
-                                pass  # No such column in df attribute - do nothing
-                            try:
-                                self.__dict__[_attr] = self.__dict__[_attr][self.__dict__[_attr]['pdb'].isin(valid_pdb_ids)]
-                            except KeyError:
-                                pass  # No such column in df attribute - do nothing
-                    # If there's no lock update also lpdb.structures and lpdb.chains
-                        self.__entries = self.__entries[self.__entries.index.isin(valid_pdb_ids)]
-                        self.__chains = self.__chains[self.__chains.index.isin(valid_pdb_chain_ids)]
+                    if self.__batch_depth > 0 and not self.__lock:
+                        # Inside the batch() block - propagate once on exit
+                        if item not in self.__pending:
+                            self.__pending.append(item)
+                    else:
+                        self.__propagate_attr(item, value)
         except AttributeError:
             pass
         super().__setattr__(item, value) # Now finally set the attribute
 
+    def __propagate_attr(self, item, value):
+        """
+        Narrows attributes donated by other plugins, lpdb.entries and lpdb.chains to the data in the changed attribute.
+        """
+        if self.__lock:
+            return
+        # Keep only pdb_ids that were in the lpdb.entries or lpdb.chains and are in the plugin
+        # (plugin may not have certain columns so try/except)
+        try:
+            entries_keep = self.__entries.index.isin(value['pdb'])
+        except KeyError:
+            entries_keep = np.zeros(len(self.__entries), dtype=bool)
+        try:
+            chains_keep = self.__chains.index.isin(value['pdb_chain'])
+        except KeyError:
+            chains_keep = np.zeros(len(self.__chains), dtype=bool)
+        valid_pdb_ids = self.__entries.index[entries_keep]
+        valid_pdb_chain_ids = self.__chains.index[chains_keep]
+
+        # Update attributes donated by other plugins. Use self.__dict__ method to bypass the setattr hook
+        for _attr in [el for el in self.__registered_attrs if el != item]:
+            try:
+                self.__dict__[_attr] = self.__dict__[_attr][
+                    self.__dict__[_attr]['pdb_chain'].isin(valid_pdb_chain_ids)]
+            except KeyError:
+                pass  # No such column in df attribute - do nothing
+            try:
+                self.__dict__[_attr] = self.__dict__[_attr][self.__dict__[_attr]['pdb'].isin(valid_pdb_ids)]
+            except KeyError:
+                pass  # No such column in df attribute - do nothing
+        # Update also lpdb.structures and lpdb.chains
+        self.__select_entries(entries_keep)
+        self.__select_chains(chains_keep)
+
     def _register_attr(self, attr):
         """
         Registers attribute donated by the Plugin to allow auto-filtering option
@@ -161,7 +233,7 @@ class PDB:
             raise ValueError(f'Attribute \'{attr}\' is not registered!')
 
     def __repr__(self):
-        return f'localpdb database (v{self.version}) holding {len(self.entries)} entries ({len(self.chains)} chains)'
+        return f'localpdb database (v{self.version}) holding {len(self.__entries)} entries ({len(self.__chains)} chains)'
 
     def load_plugin(self, plugin):
         if plugin in self._loaded_plugins:
@@ -175,18 +247,21 @@ class PDB:
             except ModuleNotFoundError:
                 raise ValueError('Plugin \'{}\'is not installed!'.format(plugin))
 
-    def _set_filenames(self, id_dict, format='pdb'):
-        id_dict, a = self._pdbv.adjust_pdb_ids(id_dict, version=self.version)
+    def _set_filenames(self, pdb_ids, format='pdb'):
+        """
+        Sets the filenames of the structure files, existence of the files is checked against the mirror manifest.
+        """
+        adjusted_ids = self._pdbv.adjust_ids(pdb_ids, version=self.version)
+        sub_dirs = adjusted_ids.index.to_series().str[1:3]
+        fns = pd.Series(np.nan, index=adjusted_ids.index, dtype=object)
         if format == 'pdb':
-            fns = {pdb_id: f'{self.db_path}/mirror/pdb/{pdb_id[1:3]}/pdb{id_dict[pdb_id]}.ent.gz' if os.path.isfile(
-                f'{self.db_path}/mirror/pdb/{pdb_id[1:3]}/pdb{id_dict[pdb_id]}.ent.gz') else 'not_compatible' if pdb_id in self.bundles else np.nan
-                   for pdb_id in id_dict.keys()}
-            self._add_col_structures(fns, ['pdb_fn'])
-        if format == 'mmCIF':
-            fns = {pdb_id: f'{self.db_path}/mirror/mmCIF/{pdb_id[1:3]}/{id_dict[pdb_id]}.cif.gz' if os.path.isfile(
-                f'{self.db_path}/mirror/mmCIF/{pdb_id[1:3]}/{id_dict[pdb_id]}.cif.gz') else np.nan
-                   for pdb_id in id_dict.keys()}
-            self._add_col_structures(fns, ['mmCIF_fn'])
+            rel_fns = sub_dirs + '/pdb' + adjusted_ids + '.ent.gz'
+            fns[adjusted_ids.index.isin(list(self.bundles))] = 'not_compatible'
+        elif format == 'mmCIF':
+            rel_fns = sub_dirs + '/' + adjusted_ids + '.cif.gz'
+        present = rel_fns.isin(load_manifest(self.db_path, format))
+        fns[present] = f'{self.db_path}/mirror/{format}/' + rel_fns[present]
+        self._add_col_structures(fns.to_frame(f'{format}_fn'))
 
     def select_updates(self, mode='am+'):
         """
@@ -217,15 +292,20 @@ class PDB:
         """
         Resets the selections done on lpdb.structures and lpdb.chains and restores the initial state of the localpdb.
         """
-        del self.__entries
-        del self.__chains
-        self.__entries = self.__entries_copy.copy()
-        self.__chains = self.__chains_copy.copy()
+        for base, base_cols in zip((self.__entries_base, self.__chains_base), self.__base_cols):
+            for col in base.columns.difference(base_cols):
+                del base[col]
+                self.__drop_range_indexes(base, [col])
+        self.__entries_pos, self.__chains_pos = None, None
+        self.__entries_cache, self.__chains_cache = None, None
+        self.__chains_joined = None
         for ph in self._loaded_plugins_handles:
             ph._reset()
 
     @property
     def chains(self):
+        if self.compact:
+            return self.__get_joined_chains()
         return self.__chains
 
     @property
@@ -234,42 +314,560 @@ class PDB:
 
     @chains.setter
     def chains(self, chains):
-        if self.auto_filter:
-            new_pdb_ids = set(chains['pdb'].tolist())
-            new_pdb_chain_ids = set(chains.index.tolist())
-            self.__entries = self.__entries[self.__entries.index.isin(new_pdb_ids)]
-            self.__lock = True
-            for ph in self._loaded_plugins_handles:
-                ph._filter_chains(new_pdb_chain_ids)
-            self.__lock = False
+        if self.compact:
+            chains = self.__strip_entry_level_cols(chains)
         self.__chains = chains
+        if self.auto_filter:
+            if self.__batch_depth > 0:
+                if 'chains' not in self.__pending:
+                    self.__pending.append('chains')
+            else:
+                self.__propagate_chains()
 
     @entries.setter
     def entries(self, entries):
-        if self.auto_filter:
-            new_pdb_ids = set(entries.index.tolist())
-            self.__chains = self.__chains[self.__chains['pdb'].isin(new_pdb_ids)]
-            self.__lock = True
-            for ph in self._loaded_plugins_handles:
-                ph._filter_entries(new_pdb_ids)
-            self.__lock = False
         self.__entries = entries
+        if self.auto_filter:
+            if self.__batch_depth > 0:
+                if 'entries' not in self.__pending:
+                    self.__pending.append('entries')
+            else:
+                self.__propagate_entries()
+
+    def __propagate_chains(self):
+        """
+        Narrows lpdb.entries and the plugin data to the current selection of chains.
+        """
+        chains_pos, entries_pos = self.__chains_pos, self.__entries_pos
+        if self.__is_base_subset(chains_pos) and self.__is_base_subset(entries_pos):
+            entries_keep = self.__map.entries_mask(chains_pos)
+            entries_keep = entries_keep if entries_pos is None else entries_keep[entries_pos]
+        else:  # Selection holds rows that are not present in the base DataFrames
+            entries_keep = self.__entries.index.isin(self.__chains['pdb'])
+        self.__select_entries(entries_keep)
+        self.__lock = True
+        for ph in self._loaded_plugins_handles:
+            ph._filter_chains(self.__chains.index)
+        self.__lock = False
+
+    def __propagate_entries(self):
+        """
+        Narrows lpdb.chains and the plugin data to the current selection of entries.
+        """
+        chains_pos, entries_pos = self.__chains_pos, self.__entries_pos
+        if self.__is_base_subset(chains_pos) and self.__is_base_subset(entries_pos):
+            chains_keep = self.__map.chains_mask(entries_pos)
+            chains_keep = chains_keep if chains_pos is None else chains_keep[chains_pos]
+        else:  # Selection holds rows that are not present in the base DataFrames
+            chains_keep = self.__chains['pdb'].isin(self.__entries.index).values
+        self.__select_chains(chains_keep)
+        self.__lock = True
+        for ph in self._loaded_plugins_handles:
+            ph._filter_entries(self.__entries.index)
+        self.__lock = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Defers the auto-filtering until the end of the block. Selections performed on lpdb.entries, lpdb.chains and
+        the attributes donated by the plugins are collected and propagated once on exit, e.g.:
+            with lpdb.batch():
+                lpdb.entries = lpdb.entries[lpdb.entries['method'] == 'diffraction']
+                lpdb.chains = lpdb.chains[lpdb.chains['seq_len'] > 50]
+        """
+        self.__batch_depth += 1
+        try:
+            yield self
+        except BaseException:  # Selections are not propagated if the block fails
+            self.__batch_depth -= 1
+            if self.__batch_depth == 0:
+                self.__pending = []
+            raise
+        self.__batch_depth -= 1
+        if self.__batch_depth == 0:
+            pending, self.__pending = self.__pending, []
+            for item in [item for item in pending if item not in ('entries', 'chains')]:
+                self.__propagate_attr(item, self.__dict__[item])
+            if 'chains' in pending:
+                self.__propagate_chains()
+            if 'entries' in pending:
+                self.__propagate_entries()
+
+    @staticmethod
+    def __get_positions(base, df):
+        """
+        @return: positions of the df rows in the base DataFrame (None if df holds all rows of the base DataFrame)
+        """
+        if df.index is base.index or df.index.equals(base.index):
+            return None
+        return base.index.get_indexer(df.index)
+
+    @staticmethod
+    def __is_base_subset(pos):
+        return pos is None or len(pos) == 0 or pos.min() >= 0
+
+    def __select_entries(self, keep):
+        """
+        Narrows the current selection of entries
+        @param keep: boolean mask over the rows of lpdb.entries
+        """
+        if keep.all():
+            return
+        pos = np.arange(len(self.__entries_base)) if self.__entries_pos is None else self.__entries_pos
+        self.__entries_pos = pos[keep]
+        if self.__entries_cache is not None:
+            self.__entries_cache = self.__entries_cache[keep]
+
+    def __select_chains(self, keep):
+        """
+        Narrows the current selection of chains
+        @param keep: boolean mask over the rows of lpdb.chains
+        """
+        if keep.all():
+            return
+        pos = np.arange(len(self.__chains_base)) if self.__chains_pos is None else self.__chains_pos
+        self.__chains_pos = pos[keep]
+        if self.__chains_cache is not None:
+            self.__chains_cache = self.__chains_cache[keep]
+
+    def __get_entries(self):
+        if self.__entries_cache is None:
+            if self.__entries_pos is None:
+                # Without Copy-on-Write the shallow copy shares the data with the base DataFrame (modifications of
+                # the selection would persist after reset())
+                self.__entries_cache = self.__entries_base.copy(deep=not _copy_on_write())
+            else:
+                self.__entries_cache = self.__entries_base.iloc[self.__entries_pos]
+        return self.__entries_cache
+
+    def __set_entries(self, entries):
+        self.__entries_pos = self.__get_positions(self.__entries_base, entries)
+        self.__entries_cache = entries
+
+    def __get_chains(self):
+        if self.__chains_cache is None:
+            if self.__chains_pos is None:
+                self.__chains_cache = self.__chains_base.copy(deep=not _copy_on_write())
+            else:
+                self.__chains_cache = self.__chains_base.iloc[self.__chains_pos]
+        return self.__chains_cache
+
+    def __set_chains(self, chains):
+        self.__chains_pos = self.__get_positions(self.__chains_base, chains)
+        self.__chains_cache = chains
+
+    # Current selections of the base DataFrames
+    __entries = property(__get_entries, __set_entries)
+    __chains = property(__get_chains, __set_chains)
+
+    def __set_compact_layout(self):
+        """
+        Converts the DataFrames to the compact memory layout. 'pdb' column of lpdb.chains becomes categorical with
+        categories equal to the lpdb.entries index - its codes are integer references to the entries.
+        """
+        for col in ['type', 'method']:
+            self.__entries_base[col] = self.__entries_base[col].astype('category')
+        self.__pdb_dtype = pd.CategoricalDtype(self.__entries_base.index)
+        self.__chains_base = self.__strip_entry_level_cols(self.__chains_base)
+
+    def __strip_entry_level_cols(self, chains):
+        """
+        Removes the entry-level columns from lpdb.chains (compact mode), these are joined from lpdb.entries on access.
+        """
+        chains = chains.drop(columns=[col for col in self._entry_level_cols if col in chains.columns])
+        if chains['pdb'].dtype != self.__pdb_dtype:
+            chains['pdb'] = chains['pdb'].astype(self.__pdb_dtype)
+        return chains
+
+    def __get_joined_chains(self):
+        """
+        Returns lpdb.chains with the joined entry-level columns (compact mode). Joined DataFrame is cached for the
+        current materialized selection and rebuilt once the selection (or any of its columns) changes.
+        """
+        chains = self.__chains
+        if self.__chains_joined is None or self.__chains_joined[0] is not chains:
+            self.__chains_joined = (chains, self.__join_entry_level_cols(chains))
+        return self.__chains_joined[1]
+
+    def __join_entry_level_cols(self, chains):
+        """
+        Joins the entry-level columns to lpdb.chains using the integer codes of the 'pdb' column (compact mode).
+        """
+        cols = [col for col in self._entry_level_cols if col in self.__entries_base.columns]
+        joined = self.__entries_base[cols].iloc[chains['pdb'].cat.codes.values]
+        joined.index = chains.index
+        pos = 2 if 'sequence' in chains.columns else 1
+        return pd.concat([chains.iloc[:, :pos], joined, chains.iloc[:, pos:]], axis=1)
+
+    def memory_usage(self):
+        """
+        Reports the memory usage of lpdb.entries and lpdb.chains per column.
+        @return: pd.DataFrame with the dtype and memory usage (in bytes) of each column in the current layout and in
+        the default (non-compact) layout
+        """
+        usage = []
+        for name, df in [('entries', self.__entries), ('chains', self.__chains)]:
+            usage.append((name, 'Index', str(df.index.dtype), df.index.memory_usage(deep=True),
+                          df.index.memory_usage(deep=True)))
+            for col in df.columns:
+                nbytes = df[col].memory_usage(deep=True, index=False)
+                usage.append((name, col, str(df[col].dtype), nbytes, self.__default_memory_usage(df[col])))
+            if name == 'chains' and self.compact:
+                joined = self.__get_joined_chains()
+                for col in [col for col in self._entry_level_cols if col in joined.columns]:
+                    usage.append((name, col, 'joined', 0, self.__default_memory_usage(joined[col])))
+        usage = pd.DataFrame(usage, columns=['df', 'column', 'dtype', 'memory', 'memory_default'])
+        return usage.set_index(['df', 'column'])
+
+    @staticmethod
+    def __default_memory_usage(col):
+        """
+        @return: memory usage (in bytes) of the column in the default (non-compact) layout
+        """
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype(col.cat.categories.dtype)
+        return col.memory_usage(deep=True, index=False)
+
+    def iter_structures(self, format='mmCIF', np=4, prefetch=16, as_text=True):
+        """
+        Iterates over the structure files of the entries in lpdb.entries. Files are read and decompressed ahead of the
+        consumer by the thread pool, entries without the structure file in the mirror are skipped, e.g.:
+            for pdb_id, data in lpdb.iter_structures(format='mmCIF', np=8):
+                ...
+        @param format: structure files format ('pdb' or 'mmCIF')
+        @param np: number of threads reading the files
+        @param prefetch: maximal number of files read ahead of the consumer
+        @param as_text: yield the content of the files as str (otherwise bytes)
+        @return: generator of the (pdb_id, content) tuples in the order of lpdb.entries
+        """
+        if format not in ['pdb', 'mmCIF']:
+            raise ValueError('\'format\' must be either \'pdb\' or \'mmCIF\'!')
+        if f'{format}_fn' not in self.__entries.columns:
+            raise RuntimeError(f'Structure files mirror in \'{format}\' format is not available!')
+        fns = self.__entries[f'{format}_fn']
+        fns = fns[fns.notna() & (fns != 'not_compatible')]
+        contents = prefetch_map(lambda fn: read_gz(fn, as_text=as_text), fns.tolist(), np=np, prefetch=prefetch)
+        return zip(fns.index, contents)
+
+    def map_entries(self, func, columns=None, np=None, chunksize=1000, name=None, print_progress=True):
+        """
+        Applies the function to each entry in lpdb.entries in the process pool (see utils.os.map_chunks), e.g.:
+            lpdb.map_entries(count_atoms, columns=['mmCIF_fn'], np=8, name='n_atoms')
+        @param func: function called with the row of lpdb.entries (namedtuple with the 'Index' and the columns)
+        @param columns: columns of lpdb.entries passed to the function (default: None - all columns)
+        @param np: number of processes (default: None - number of CPUs)
+        @param chunksize: number of entries processed by the single job
+        @param name: if set the results are added to lpdb.entries as the column with this name
+        @param print_progress: print simple progress bar
+        @return: pd.Series with the function outputs indexed by the pdb ids (see utils.os.map_chunks for the
+        per-chunk report)
+        """
+        df = self.__entries if columns is None else self.__entries[columns]
+        results = map_chunks(func, df, np=np, chunksize=chunksize, print_progress=print_progress)
+        if name is not None:
+            self._add_col_structures(results.to_frame(name))
+        return results
+
+    def map_chains(self, func, columns=None, np=None, chunksize=1000, name=None, print_progress=True):
+        """
+        Applies the function to each chain in lpdb.chains in the process pool (see map_entries)
+        @param func: function called with the row of lpdb.chains (namedtuple with the 'Index' and the columns)
+        @param columns: columns of lpdb.chains passed to the function (default: None - all columns)
+        @param np: number of processes (default: None - number of CPUs)
+        @param chunksize: number of chains processed by the single job
+        @param name: if set the results are added to lpdb.chains as the column with this name
+        @param print_progress: print simple progress bar
+        @return: pd.Series with the function outputs indexed by the pdb_chain ids
+        """
+        df = self.chains if columns is None else self.chains[columns]
+        results = map_chunks(func, df, np=np, chunksize=chunksize, print_progress=print_progress)
+        if name is not None:
+            self._add_col_chains(results.to_frame(name))
+        return results
+
+    def get_sequences(self, ids=None):
+        """
+        Fetches the sequences of the chains. Works regardless of the 'lazy_sequences' setting.
+        @param ids: pdb_chain identifiers (default: None - all chains in lpdb.chains)
+        @return: pd.Series with sequences indexed by the pdb_chain identifiers
+        """
+        if ids is None:
+            ids = self.__chains.index
+        return self._seqres.get(ids)
+
+    def load_sequences(self):
+        """
+        Adds the 'sequence' column to lpdb.chains for the chains in the current selection (used with
+        'lazy_sequences' option). Column is stored in the base DataFrame and kept on reset(), sequences of the chains
+        outside of the selection are missing until load_sequences() is called for them.
+        """
+        base = self.__chains_base
+        if 'sequence' not in base.columns:
+            base.insert(1, 'sequence', pd.Series(np.nan, index=base.index, dtype=object))
+            self.__base_cols = (self.__base_cols[0], base.columns)
+        pos = np.arange(len(base)) if self.__chains_pos is None else self.__chains_pos[self.__chains_pos >= 0]
+        pos = pos[base['sequence'].isna().values[pos]]
+        if len(pos) > 0:
+            base.iloc[pos, base.columns.get_loc('sequence')] = self.get_sequences(base.index[pos]).values
+        if self.__chains_cache is not None:
+            cache = self.__chains_cache.drop(columns='sequence', errors='ignore')
+            cache.insert(1, 'sequence', base['sequence'].reindex(cache.index).values)
+            self.__chains_cache = cache
+
+    def unique_sequences(self):
+        """
+        Groups the chains in lpdb.chains with identical sequences (compared by the 'seq_id' hashes). Per-sequence
+        computations can be run once for each unique sequence and broadcast back to the chains with the 'seq_id'
+        column, e.g. lpdb.chains['seq_id'].map(results).
+        @return: pd.DataFrame indexed by the 'seq_id' with the 'sequence', the representative chain ('pdb_chain' -
+        first chain with the sequence), 'seq_len' and the number of chains ('n_chains')
+        """
+        seq_ids = self.__chains['seq_id']
+        first = ~seq_ids.duplicated().values
+        unique = pd.DataFrame({'pdb_chain': self.__chains.index[first]},
+                              index=pd.Index(seq_ids.values[first], name='seq_id'))
+        unique['sequence'] = self.get_sequences(unique['pdb_chain']).values
+        unique['seq_len'] = self.__chains['seq_len'].values[first]
+        unique['n_chains'] = seq_ids.value_counts(sort=False).reindex(unique.index).values
+        return unique
+
+    def get_sequence_arena(self, ids=None, mmap=True):
+        """
+        Fetches the integer-encoded sequences of the chains in a single contiguous buffer (see SequenceArena).
+        @param ids: pdb_chain identifiers (default: None - all chains in lpdb.chains)
+        @param mmap: memory map the arena from the data directory of the loaded version (shared between processes)
+        @return: SequenceArena with sequences ordered as the ids
+        """
+        if self._arena is None or (self._arena.fn is not None) != mmap:
+            self._arena = load_sequence_arena(self._working_path, self._seqres, mmap=mmap)
+        return self._arena.take(self.__chains.index if ids is None else ids)
+
+    def find_subsequence(self, sequence, max_mismatches=0, return_type='polymer_instance', no_hits=1000,
+                         select=False):
+        """
+        Get dataframe with chains (or entries) containing given subsequence. Search is performed locally using the
+        k-mer index of the sequences (built on the first search and stored in the data directory of the loaded version)
+        and returns the DataFrame in the format of the remote search methods (e.g. search_seq).
+        :param sequence: (str) subsequence to find in the sequences of lpdb.chains
+        :param max_mismatches: (int) maximal number of mismatches (substitutions) between the subsequence and the match
+        :param return_type: (str) type of returned data - either 'entry' or 'polymer_instance'
+        :param no_hits: (int) number of hits to fetch, -1 for all results
+        :param select: (bool) if True results of the query will be propagated to either lpdb.entries or lpdb.chains
+        (depending on the return_type parameter)
+        :return: pd.DataFrame indexed with the identifiers of the hits with columns 'score' (identity of the best
+        match), 'orginal_score' (number of identical residues of the best match), 'norm_score' (same as 'score') and
+        'match_context' (list of matches with 1-based 'start' and 'end' residues and number of 'mismatches')
+        """
+        if return_type not in ['entry', 'polymer_instance']:
+            raise ValueError('\'return_type\' must be either \'entry\' or \'polymer_instance\'!')
+        if self._kmer_index is None:
+            self._kmer_index = load_kmer_index(self._working_path, self._seqres)
+        rows, starts, mismatches = self._kmer_index.find(sequence, max_mismatches=max_mismatches)
+        hits = pd.DataFrame({'pdb_chain': self._seqres.ids[rows], 'start': starts + 1,
+                             'end': starts + len(sequence), 'mismatches': mismatches})
+        hits = hits[hits['pdb_chain'].isin(self.__chains.index)]
+        if return_type == 'entry':
+            hits['identifier'] = hits['pdb_chain'].map(self.__chains['pdb']).astype(str)
+        else:
+            hits['identifier'] = hits['pdb_chain']
+            hits = hits.drop(columns='pdb_chain')
+        hits = hits.sort_values('mismatches', kind='stable')  # Best match of each identifier goes first
+        match_context = {}
+        for identifier, match in zip(hits['identifier'], hits.drop(columns='identifier').to_dict('records')):
+            match_context.setdefault(identifier, []).append(match)
+        original_scores = [len(sequence) - matches[0]['mismatches'] for matches in match_context.values()]
+        scores = [score / max(len(sequence), 1) for score in original_scores]
+        results = pd.DataFrame({'score': scores, 'orginal_score': original_scores, 'norm_score': scores,
+                                'match_context': list(match_context.values())},
+                               index=pd.Index(list(match_context), name='identifier'))
+        if no_hits != -1:
+            results = results.iloc[:no_hits]
+        if select:
+            if return_type == 'entry':
+                self.entries = self.entries[self.entries.index.isin(results.index)]
+            elif return_type == 'polymer_instance':
+                self.chains = self.chains[self.chains.index.isin(results.index)]
+        else:
+            return results
+
+    def __similarity_candidates(self, sequence, max_candidates):
+        """
+        Selects the chains sharing the most k-mers with the query (prefilter of the local similarity search)
+        @return: identifiers of the candidate chains and number of residues in the chains of lpdb.chains
+        """
+        if self._kmer_index is None:
+            self._kmer_index = load_kmer_index(self._working_path, self._seqres)
+        shared = self._kmer_index.shared_kmers(sequence)
+        selected = self._seqres.ids.get_indexer(self.__chains.index)
+        selected = selected[selected >= 0]
+        candidates = selected[shared[selected] > 0]
+        candidates = candidates[np.argsort(-shared[candidates], kind='stable')[:max_candidates]]
+        return self._seqres.ids[np.sort(candidates)], int(np.diff(self._seqres.offsets)[selected].sum())
+
+    def search_seq_local(self, sequence, evalue=1, identity=0.9, return_type='polymer_instance', no_hits=1000,
+                         max_candidates=2000, np=None, select=False):
+        """
+        Get dataframe with chains (or entries) having sequence similar to given sequence. Search is performed locally -
+        chains sharing the most k-mers with the sequence (k-mer index is built on the first search) are aligned to it
+        (Smith-Waterman, BLOSUM62) in the worker processes.
+        :param sequence: (str) sequence used to find similar ones
+        :param evalue: (float) maximal e-value of the hit
+        :param identity: (float) minimum identity to input sequence (fraction of identical residues in the alignment)
+        :param return_type: (str) type of returned data - either 'entry' or 'polymer_instance'
+        :param no_hits: (int) number of hits to fetch, -1 for all results
+        :param max_candidates: (int) maximal number of chains aligned to the sequence
+        :param np: (int) number of processes (None - number of CPUs)
+        :param select: (bool) if True results of the query will be propagated to either lpdb.entries or lpdb.chains
+        (depending on the return_type parameter)
+        :return: pd.DataFrame in the format of the search_seq results - 'score' and 'norm_score' (bit score relative to
+        the best hit), 'orginal_score' (bit score) and 'match_context' (alignment statistics)
+        """
+        if return_type not in ['entry', 'polymer_instance']:
+            raise ValueError('\'return_type\' must be either \'entry\' or \'polymer_instance\'!')
+        candidates, db_size = self.__similarity_candidates(sequence, max_candidates)
+        hits = align_candidates(sequence, self._seqres.get(candidates), db_size, max_evalue=evalue,
+                                min_identity=identity, np=np)
+        if return_type == 'entry':
+            hits.insert(0, 'identifier', hits['pdb_chain'].map(self.__chains['pdb']).astype(str))
+        else:
+            hits = hits.rename(columns={'pdb_chain': 'identifier'})
+        match_context = {}  # Hits are sorted by e-value - best hit of each identifier goes first
+        for identifier, match in zip(hits['identifier'], hits.drop(columns='identifier').to_dict('records')):
+            match_context.setdefault(identifier, []).append(match)
+        original_scores = [matches[0]['bitscore'] for matches in match_context.values()]
+        scores = [score / max(original_scores) for score in original_scores]
+        results = pd.DataFrame({'score': scores, 'orginal_score': original_scores, 'norm_score': scores,
+                                'match_context': list(match_context.values())},
+                               index=pd.Index(list(match_context), name='identifier'))
+        if no_hits != -1:
+            results = results.iloc[:no_hits]
+        if select:
+            if return_type == 'entry':
+                self.entries = self.entries[self.entries.index.isin(results.index)]
+            elif return_type == 'polymer_instance':
+                self.chains = self.chains[self.chains.index.isin(results.index)]
+        else:
+            return results
+
+    def scan_seq_motifs(self, motifs, type_='prosite', np=None, select=False):
+        """
+        Get dataframe with occurrences of the sequence motifs in the chains. Search is performed locally - sequences of
+        lpdb.chains are scanned once for all motifs in the worker processes.
+        :param motifs: (str or list) motif or list of motifs to find in pdb sequences, according to given type_
+        :param type_: (str) type of the motifs - 'prosite', 'simple' or 'regex'
+        :param np: (int) number of processes (None - number of CPUs)
+        :param select: (bool) if True chains with at least one occurrence will be selected in lpdb.chains
+        :return: pd.DataFrame with the 'pdb_chain', 'motif', 'start' and 'end' (1-based, inclusive) of each occurrence
+        """
+        if isinstance(motifs, str):
+            motifs = [motifs]
+        sequences = self.__chains['sequence'] if 'sequence' in self.__chains.columns else self.get_sequences()
+        results = scan_motifs(sequences, motifs, type_=type_, np=np)
+        if select:
+            self.chains = self.chains[self.chains.index.isin(results['pdb_chain'])]
+        else:
+            return results
 
     def _add_col_structures(self, data, added_col_name=[]):
-        if len(set(added_col_name) & set(self.__entries.columns)) > 0:
+        if len(set(added_col_name) & set(self.__entries_base.columns)) > 0:
             raise ValueError('At least one added column name is already present in \'lpdb.structures\' df!')
         if isinstance(data, dict):
             data = pd.DataFrame.from_dict({key: [value] for key, value in data.items()}, orient='index',
                                           columns=added_col_name)
-        self.__entries = pd.merge(self.entries, data, left_index=True, right_index=True, how='left')
+        self.__add_cols(self.__entries_base, data)
+        self.__drop_range_indexes(self.__entries_base, data.columns)
+        if self.__entries_cache is not None:
+            self.__entries_cache = pd.merge(self.__entries_cache, data, left_index=True, right_index=True, how='left')
 
     def _add_col_chains(self, data, added_col_name=[]):
-        if len(set(added_col_name) & set(self.__chains.columns)) > 0:
+        if len(set(added_col_name) & set(self.__chains_base.columns)) > 0:
             raise ValueError('At least one added column name is already present in \'lpdb.chains\' df!')
         if isinstance(data, dict):
             data = pd.DataFrame.from_dict({key: [value] for key, value in data.items()}, orient='index',
                                           columns=added_col_name)
-        self.__chains = pd.merge(self.chains, data, left_index=True, right_index=True, how='left')
+        self.__add_cols(self.__chains_base, data)
+        self.__drop_range_indexes(self.__chains_base, data.columns)
+        if self.__chains_cache is not None:
+            self.__chains_cache = pd.merge(self.__chains_cache, data, left_index=True, right_index=True, how='left')
+
+    @staticmethod
+    def __add_cols(base, data):
+        """
+        Adds the columns to the base DataFrame in place (rows missing in data are filled with NaNs)
+        """
+        if not data.index.is_unique:
+            duplicated = ', '.join(map(str, data.index[data.index.duplicated()].unique()[:5]))
+            raise ValueError(f'Index of the added data must be unique! Duplicated identifiers: {duplicated}')
+        for col in data.columns:
+            base[col] = data[col].reindex(base.index)
+
+    def __drop_range_indexes(self, base, cols):
+        """
+        Removes the sorted indexes of the changed columns of the base DataFrame
+        """
+        name = 'entries' if base is self.__entries_base else 'chains'
+        for col in cols:
+            self.__range_indexes.pop((name, col), None)
+
+    def __selected_rows(self, name, base_rows):
+        """
+        Maps the rows of the base DataFrame to the rows of the current selection
+        @param name: either 'entries' or 'chains'
+        @param base_rows: sorted positions of the rows in the base DataFrame
+        @return: positions of the rows in the current selection (rows missing in the selection are skipped)
+        """
+        base, pos = (self.__entries_base, self.__entries_pos) if name == 'entries' else \
+            (self.__chains_base, self.__chains_pos)
+        if pos is None:
+            return base_rows
+        cached_pos, inverse = self.__inverse_pos.get(name, (None, None))
+        if cached_pos is not pos:  # Selection changed since the last query
+            valid = np.flatnonzero(pos >= 0)
+            inverse = np.full(len(base), -1, dtype=np.int64)
+            inverse[pos[valid]] = valid
+            self.__inverse_pos[name] = (pos, inverse)
+        rows = inverse[base_rows]
+        return np.sort(rows[rows >= 0])
+
+    def select_range(self, column, lo=None, hi=None, select=False):
+        """
+        Get dataframe with entries or chains having the column values within the [lo, hi] range (bounds are inclusive),
+        e.g. lpdb.select_range('resolution', hi=2.0) or lpdb.select_range('deposition_date', '2020-01-01', '2020-12-31').
+        Columns of the base DataFrames (including the ones added by the plugins) are queried with the sorted indexes
+        built on the first query of the column, other columns are scanned.
+        :param column: (str) numeric or date column of lpdb.entries or lpdb.chains (lpdb.entries is queried if the
+        column is present in both)
+        :param lo: lower bound of the range (None - no lower bound)
+        :param hi: upper bound of the range (None - no upper bound)
+        :param select: (bool) if True results of the query will be propagated to either lpdb.entries or lpdb.chains
+        (depending on the queried column)
+        :return: pd.DataFrame
+        """
+        if column in self.__entries_base.columns or column in self.__chains_base.columns:
+            name, base = ('entries', self.__entries_base) if column in self.__entries_base.columns else \
+                ('chains', self.__chains_base)
+            if (name, column) not in self.__range_indexes:
+                self.__range_indexes[(name, column)] = SortedIndex(base[column])
+            rows = self.__selected_rows(name, self.__range_indexes[(name, column)].rows(lo, hi))
+            results = self.__entries.iloc[rows] if name == 'entries' else self.__chains.iloc[rows]
+            if name == 'chains' and self.compact:
+                results = self.__join_entry_level_cols(results)
+        else:  # Column added to the current selection only
+            name = 'entries' if column in self.__entries.columns else 'chains'
+            df = self.entries if name == 'entries' else self.chains
+            keep = df[column].notna()
+            if lo is not None:
+                keep &= df[column] >= lo
+            if hi is not None:
+                keep &= df[column] <= hi
+            results = df[keep.values]
+        if select:
+            if name == 'entries':
+                self.entries = results
+            else:
+                self.chains = results
+        else:
+            return results
 
     def search_seq_motif(self, query, type_='prosite', return_type="entry", no_hits=1000, select=False):
         """
@@ -282,7 +880,7 @@ class PDB:
         (depending on the return_type parameter)
         :return: pd.DataFrame
         """
-        results = self.__rest_api_commands.get('seqmotif')(query, type_,
+        results = self._rest_api_commands.get('seqmotif')(query, type_,
                                                            resp_type=return_type,
                                                            rows=no_hits).execute()
         if select:
@@ -306,7 +904,7 @@ class PDB:
         (depending on the return_type parameter)
         :return: pd.DataFrame
         """
-        results = self.__rest_api_commands.get('sequence')(sequence, evalue, identity,
+        results = self._rest_api_commands.get('sequence')(sequence, evalue, identity,
                                                            resp_type=return_type, rows=no_hits).execute()
         if select:
             if return_type == 'entry':
@@ -329,7 +927,7 @@ class PDB:
         (depending on the return_type parameter)
         :return: pd.DataFrame
         """
-        results = self.__rest_api_commands.get('structure')(pdb_id, assembly_id, operator,
+        results = self._rest_api_commands.get('structure')(pdb_id, assembly_id, operator,
                                                             resp_type=return_type, rows=no_hits).execute()
         if select:
             if return_type == 'entry':
@@ -353,7 +951,7 @@ class PDB:
         (depending on the return_type parameter)
         :return: pd.DataFrame
         """
-        results = self.__rest_api_commands.get('strucmotif')(pdb_id, residue_ids, score_cutoff, exchanges,
+        results = self._rest_api_commands.get('strucmotif')(pdb_id, residue_ids, score_cutoff, exchanges,
                                                              resp_type=return_type, rows=no_hits).execute()
         if select:
             if return_type == 'entry':
@@ -372,14 +970,15 @@ class PDB:
         :param return_type: (str) type of returned data
         :param no_hits: (int) number of hits to fetch, -1 for all results
         :param get_doc_only: (bool) if True get datafarame with description of possible attributes and operators
+        (downloaded once and cached in the localpdb directory)
         :param select: (bool) if True results of the query will be propagated to either lpdb.entries or lpdb.chains
         (depending on the return_type parameter)
         :return: pd.DataFrame
         """
-        command = self.__rest_api_commands.get('text')(attribute, operator, value,
+        command = self._rest_api_commands.get('text')(attribute, operator, value,
                                                        resp_type=return_type, rows=no_hits)
         if get_doc_only:
-            return command.get_doc()
+            return command.get_doc(cache_fn=self.db_path / METADATA_CACHE_FN)
         results = command.execute()
         if select:
             if return_type == 'entry':
@@ -392,8 +991,12 @@ class PDB:
     def extract(self, out_fn):
         if self.__config['struct_mirror']['pdb']:
             warnings.warn('Extracting localpdb data is not compatible with the structure files mirror in PDB format!')
+        # Snapshot is skipped as it can be rebuilt from the raw files
+        snapshot_fns = {SNAPSHOT_FN, SNAPSHOT_INFO_FN, SEQRES_FN, SEQRES_IDX_FN, SEQRES_ARENA_FN, SEQRES_KMER_FN,
+                        SEQRES_KMER_IDX_FN}
         with tarfile.open(out_fn, mode='w:gz') as arch:
-            arch.add(self._working_path, arcname='/'.join(self._working_path.split('/')[-2:]))
+            arch.add(self._working_path, arcname='/'.join(self._working_path.split('/')[-2:]),
+                     filter=lambda info: None if os.path.basename(info.name) in snapshot_fns else info)
 
     def _get_current_indexes(self):
         """
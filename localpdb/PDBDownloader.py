@@ -5,12 +5,14 @@ import sys
 import shutil
 import json
 import requests
+import concurrent.futures
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 from .PDBVersioneer import PDBVersioneer
 from localpdb.utils.os import set_last_modified, os_cmd, parse_simple
-from localpdb.utils.network import get_last_modified, download_url
+from localpdb.utils.network import download_url, PARTIAL_DIR
+from localpdb.utils.mirror import build_manifest
 
 logger = logging.getLogger(__name__)
 
@@ -44,8 +46,14 @@ class PDBDownloader:
             logger.error('You can manually override this error by running:')
             logger.error(f'rm {self.db_path}/.lock')
             sys.exit(1)
+        # Size of the versioning store - revisions appended during the session are truncated on failure
+        self.pdbv.load_versioning()
         try:
-            shutil.copy(f'{self.db_path}/data/versioning.log', f'{self.db_path}/data/.versioning.log.bk')
+            self.versioning_size = os.path.getsize(self.pdbv.versioning_fn)
+        except FileNotFoundError:
+            self.versioning_size = None
+        try:  # JSON versioning log kept for the earlier localpdb versions (restored on failure)
+            shutil.copy2(f'{self.db_path}/data/versioning.log', f'{self.db_path}/data/.versioning.log.bk')
         except FileNotFoundError:
             pass
         self.cp_files = []
@@ -111,12 +119,60 @@ class PDBDownloader:
         @param file_type: file type to download.
         @return: True if downloaded was completed and validated.
         """
+        return self.download_files([file_type])[file_type]
+
+    def download_files(self, file_types, np=8, retries=3):
+        """
+        Downloads the selected file types from the selected PDB mirror. Files (including the weekly lists of all
+        missing versions in the update mode) are fetched concurrently, then validated and merged in the order of
+        the file types. Interrupted downloads are resumed from the partial files kept in the '.partial' directory of
+        the localpdb directory (not removed by the clean_unsuccessful).
+        @param file_types: list of the file types to download
+        @param np: number of concurrent downloads
+        @param retries: number of retries of each failed download
+        @return: dict {file_type: True if download was completed and validated}
+        """
+        jobs = {dest: url for file_type in file_types for url, dest in self.__download_jobs(file_type)}
+        downloaded = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=np) as executor:
+            futures = {executor.submit(download_url, url, dest, retries=retries,
+                                       partial_dir=self.db_path / PARTIAL_DIR): dest for dest, url in jobs.items()}
+            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), unit='file'):
+                downloaded[futures[future]] = future.result()
+        return {file_type: self.__finalize_download(file_type, downloaded) for file_type in file_types}
+
+    def __download_jobs(self, file_type):
+        """
+        Generates the download urls and destinations of the selected file type
+        @param file_type: file type
+        @return: list of the (url, destination) tuples
+        """
         if file_type in ['entries', 'bundles', 'entries_type', 'resolution', 'seqres']:
             dest = f'{self.db_path}/data/{self.version}/pdb_{file_type}.txt'
             if file_type == 'seqres':
                 dest = '{}.gz'.format(dest)
-            url = self.__gen__url(file_type=file_type)
-            if download_url(url, dest):
+            return [(self.__gen__url(file_type=file_type), dest)]
+        elif file_type in ['added', 'modified', 'obsolete']:
+            jobs = [(self.__gen__url(file_type=file_type, version=self.version),
+                     f'{self.db_path}/data/{self.version}/{file_type}.txt')]
+            if self.versions is not None:
+                jobs.extend((self.__gen__url(file_type=file_type, version=version),
+                             f'{self.db_path}/data/{self.version}/tmp_{version}_{file_type}.txt')
+                            for version in self.versions)
+            return jobs
+        raise ValueError('Unknown file type, cannot generate download url!')
+
+    def __finalize_download(self, file_type, downloaded):
+        """
+        Validates the downloaded files of the selected file type, merges the weekly lists of the missing versions and
+        updates the versioning store with the major revisions.
+        @param file_type: file type
+        @param downloaded: dict {destination: True if downloaded}
+        @return: True if files were downloaded and validated
+        """
+        if file_type in ['entries', 'bundles', 'entries_type', 'resolution', 'seqres']:
+            (_, dest), = self.__download_jobs(file_type)
+            if downloaded[dest]:
                 if file_type == 'bundles':
                     return True
                 else:
@@ -125,32 +181,32 @@ class PDBDownloader:
                 return False
 
         elif file_type in ['added', 'modified', 'obsolete']:
-            url = self.__gen__url(file_type=file_type, version=self.version)
             dest = f'{self.db_path}/data/{self.version}/{file_type}.txt'
-            results = [self.__verify_timestamp(dest, lazy = True if file_type=='obsolete' else False) if download_url(url, dest) else False]
+            results = [self.__verify_timestamp(dest, lazy = True if file_type=='obsolete' else False) if downloaded[dest] else False]
 
-            if file_type == 'modified':
+            if file_type == 'modified' and results[0]:
                 modified_dict, status = self.fetch_major_revisions()
                 results.append(status)
             if self.versions is not None:
                 dest_merged = f'{self.db_path}/data/{self.version}/{file_type}_merged.txt'
+                last_modified = None
                 with open(dest_merged, 'w') as f:
                     for version in self.versions:
                         tmp_dest = f'{self.db_path}/data/{self.version}/tmp_{version}_{file_type}.txt'
-                        url = self.__gen__url(file_type=file_type, version=version)
-                        if download_url(url, tmp_dest):
+                        if downloaded[tmp_dest]:
                             if file_type != 'obsolete':
                                 results.append(self.__verify_timestamp(tmp_dest, version=version))
                             else:
                                 results.append(True)
                             with open(tmp_dest) as f_tmp:
                                 f.write(f_tmp.read())
+                            last_modified = os.path.getmtime(tmp_dest)
                             os.remove(tmp_dest)
                         else:
                             results.append(False)
-                last_modified = get_last_modified(url)
-                set_last_modified(dest_merged, last_modified)
-                if file_type == 'modified':
+                if last_modified is not None:
+                    set_last_modified(dest_merged, last_modified)
+                if file_type == 'modified' and all(results):
                     modified_dict, status = self.fetch_major_revisions(merged=True)
                     results.append(status)
             if all(results) and file_type == 'modified':
@@ -198,23 +254,14 @@ class PDBDownloader:
 
     def update_versioning_log(self, modified_dict):
         """
-        Updates the versioning.log file that keeps the major modifications of PDB entries.
+        Updates the versioning store that keeps the major modifications of PDB entries (revisions are appended).
         @param modified_dict: Revision data (dictionary from the self.fetch_major_revisions)
         @return: True if update succeeded, False otherwise
         """
-        logs_fn = f'{self.db_path}/data/versioning.log'
-        try:
-            with open(logs_fn) as f:
-                ver_history = json.loads(f.read())
-            for pdb_id, rev_ver in modified_dict.items():
-                if pdb_id in ver_history.keys():
-                    ver_history[pdb_id].append(rev_ver)
-                else:
-                    ver_history[pdb_id] = [rev_ver]
-        except FileNotFoundError:
-            ver_history = {}
-        with open(logs_fn, 'w') as f:
-            f.write(json.dumps(ver_history, indent=4))
+        if os.path.isfile(self.pdbv.versioning_fn):
+            self.pdbv.append_versioning(modified_dict)
+        else:
+            self.pdbv.append_versioning({})  # Fresh setup - create the empty store
         return True
 
     def rsync_pdb_mirror(self, format='pdb', update=False):
@@ -274,6 +321,7 @@ class PDBDownloader:
         tqdm_str = f'tqdm --unit_scale --unit=item --dynamic_ncols=True --total={n_structs} >> /dev/null '
         rsync_cmd = f'rsync -rlpt -v {add_opts} {url}/{format}/ {local_mirror}/ | {tqdm_str}'
         result = os.system(rsync_cmd)
+        build_manifest(self.db_path, format)  # Refresh the list of structure files present in the mirror
         return result
 
     def fetch_version_info(self, out_fn=None, entries_fn=None):
@@ -320,6 +368,8 @@ class PDBDownloader:
                 shutil.move(f'{self.db_path}/data/.versioning.log.bk', f'{self.db_path}/data/versioning.log')
             except FileNotFoundError:
                 pass
+            if self.versioning_size is not None:
+                os.truncate(self.pdbv.versioning_fn, self.versioning_size)
             for s in rm_strings:
                 try:
                     shutil.rmtree(s)
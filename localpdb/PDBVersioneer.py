@@ -4,19 +4,29 @@ import logging
 import json
 import datetime
 import warnings
+import numpy as np
+import pandas as pd
 from pathlib import Path
 from urllib.parse import urlparse
 from localpdb.utils.os import create_directory, custom_warning
+from localpdb.utils.cache import MetadataCache, METADATA_CACHE_FN
 logger = logging.getLogger(__name__)
 
 warnings.showwarning = custom_warning
 
+VERSIONING_FN = 'versioning.tsv'  # Major revisions of the PDB entries - 'pdb_id<TAB>version' lines, append-only
+LEGACY_VERSIONING_FN = 'versioning.log'  # JSON versioning log of the earlier localpdb versions (kept up to date if present)
+REMOTE_VERSIONS_TTL = 3600  # Expiration time (s) of the cached listing of the remote PDB versions
+
 
 class PDBVersioneer:
 
-    def __init__(self, db_path, config=None):
+    def __init__(self, db_path, config=None, refresh_metadata=False):
         self.config = config
         self.db_path = Path(db_path)
+        self.refresh_metadata = refresh_metadata  # Ignore the remote metadata cached in the previous runs
+        self.versioning_fn = f'{self.db_path}/data/{VERSIONING_FN}'
+        self.__versioning = None  # Memoized versioning store and the (size, mtime) of the file it was read from
         # Check local versions (read log)
         try:
             with open('{}/data/status.log'.format(self.db_path)) as f: #TODO
@@ -43,6 +53,89 @@ class PDBVersioneer:
         with open(logs_fn, 'w') as f:
             f.write(json.dumps(logs, indent=4))
 
+    def load_versioning(self):
+        """
+        Loads the versioning store with the major revisions of the PDB entries. Store is read once and memoized until
+        the file changes. JSON versioning log of the earlier localpdb versions is migrated on the first use and again
+        if it was modified afterwards (database updated by the earlier localpdb version).
+        @return: pd.DataFrame with the 'pdb' and 'version' columns sorted by the pdb ids and versions
+        """
+        legacy_fn = f'{self.db_path}/data/{LEGACY_VERSIONING_FN}'
+        try:
+            legacy_mtime = os.stat(legacy_fn).st_mtime_ns
+        except FileNotFoundError:
+            legacy_mtime = None
+        if legacy_mtime is not None and (not os.path.isfile(self.versioning_fn) or
+                                         legacy_mtime > os.stat(self.versioning_fn).st_mtime_ns):
+            self.__migrate_versioning(legacy_fn)
+        try:
+            stat = os.stat(self.versioning_fn)
+            key = (stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            key = None
+        if self.__versioning is None or self.__versioning[0] != key:
+            if key is None or key[0] == 0:
+                history = pd.DataFrame({'pdb': pd.Series([], dtype=object), 'version': pd.Series([], dtype=np.int64)})
+            else:
+                history = pd.read_csv(self.versioning_fn, sep='\t', names=['pdb', 'version'],
+                                      dtype={'pdb': object, 'version': np.int64})
+            history = history.sort_values(['pdb', 'version'], kind='stable').reset_index(drop=True)
+            self.__versioning = (key, history)
+        return self.__versioning[1]
+
+    def __migrate_versioning(self, legacy_fn):
+        """
+        Converts the JSON versioning log to the versioning store. JSON log is left in place for the earlier localpdb
+        versions sharing the database.
+        """
+        with open(legacy_fn) as f:
+            history = json.loads(f.read())
+        lines = ''.join(f'{pdb_id}\t{version}\n' for pdb_id, versions in sorted(history.items()) for version in versions)
+        with open(f'{self.versioning_fn}.tmp', 'w') as f:
+            f.write(lines)
+        os.replace(f'{self.versioning_fn}.tmp', self.versioning_fn)
+        logger.debug(f'Migrated \'{legacy_fn}\' to \'{self.versioning_fn}\'.')
+
+    def append_versioning(self, revisions):
+        """
+        Appends the major revisions of the PDB entries to the versioning store (store is created if missing). JSON
+        versioning log is rewritten with the revisions if it exists - it can be removed once no earlier localpdb
+        version uses the database.
+        @param revisions: dict {pdb_id: version}
+        """
+        self.load_versioning()  # Migrate the JSON versioning log first
+        legacy_fn = f'{self.db_path}/data/{LEGACY_VERSIONING_FN}'
+        if os.path.isfile(legacy_fn):  # Written before the store so that it is not newer than the store
+            with open(legacy_fn) as f:
+                history = json.loads(f.read())
+            for pdb_id, version in revisions.items():
+                history.setdefault(pdb_id, []).append(version)
+            with open(f'{legacy_fn}.tmp', 'w') as f:
+                f.write(json.dumps(history, indent=4))
+            os.replace(f'{legacy_fn}.tmp', legacy_fn)
+        with open(self.versioning_fn, 'a') as f:
+            f.write(''.join(f'{pdb_id}\t{version}\n' for pdb_id, version in revisions.items()))
+
+    def adjust_ids(self, ids, version, mode='load'):
+        """
+        Resolves the identifiers of the entries that had the major revisions (e.g. '1abc' -> '1abc_b20210521')
+        @param ids: pdb ids
+        @param version: localpdb version to check
+        @param mode: Either 'load' (first revision after the version) or 'setup' (last revision up to the version)
+        @return: pd.Series with the adjusted ids indexed by the ids
+        """
+        history = self.load_versioning()
+        if mode == 'setup':
+            revisions = history[history['version'] <= version].drop_duplicates('pdb', keep='last')
+        else:
+            revisions = history[history['version'] > version].drop_duplicates('pdb', keep='first')
+        ids = pd.Index(ids, dtype=object)
+        versions = revisions.set_index('pdb')['version'].reindex(ids)
+        changed = versions.notna().values
+        adjusted = pd.Series(ids, index=ids, dtype=object)
+        adjusted[changed] = ids[changed] + '_b' + versions[changed].astype(np.int64).astype(str).values
+        return adjusted
+
     def adjust_pdb_ids(self, id_dict, version, mode='load'):
         """
         @param id_dict: Entries - dict {id: id} format
@@ -50,26 +143,9 @@ class PDBVersioneer:
         @param mode: Either 'load' or 'setup'
         @returns Modified entries dict {id: adjusted_id)
         """
-        curr_ids = set(id_dict.keys())
-        log_fn = f'{self.db_path}/data/versioning.log'
-        change_dict = {}
-        try:
-            with open(log_fn) as f:
-                history = json.loads(f.read())
-        except FileNotFoundError:
-            history = {}
-        for key, h in history.items():
-            if mode == 'setup':
-                vers = [ver for ver in h if ver <= version]
-            else:
-                vers = [ver for ver in h if ver > version]
-            if len(vers) > 0 and key in curr_ids:
-                if mode == 'setup':
-                    id_dict[key] = f'{key}_b{max(vers)}'
-                    change_dict[key] = f'{key}_b{max(vers)}'
-                else:
-                    id_dict[key] = f'{key}_b{min(vers)}'
-                    change_dict[key] = f'{key}_b{min(vers)}'
+        adjusted = self.adjust_ids(list(id_dict.keys()), version, mode=mode)
+        change_dict = adjusted[adjusted.index != adjusted.values].to_dict()
+        id_dict.update(change_dict)
         return id_dict, change_dict
 
     def init(self):
@@ -127,9 +203,19 @@ class PDBVersioneer:
     @property
     def remote_pdb_versions(self):
         """
-        Checks for the remote PDB versions in the PDB ftp mirror
+        Checks for the remote PDB versions in the PDB ftp mirror. Listing is cached (see REMOTE_VERSIONS_TTL) in the
+        localpdb directory once it is set up.
         @return: sorted list of the remote PDB versions available in the PDB ftp mirror
         """
+        cache_fn = self.db_path / METADATA_CACHE_FN if self.check_init() else None
+        cache = MetadataCache(cache_fn, refresh=self.refresh_metadata)
+        return cache.get(f'remote_pdb_versions:{self.config["ftp_url"]}', self.__list_remote_pdb_versions,
+                         ttl=REMOTE_VERSIONS_TTL)
+
+    def __list_remote_pdb_versions(self):
+        """
+        Lists the remote PDB versions in the PDB ftp mirror
+        """
         p = urlparse('ftp://' + self.config['ftp_url'])
         ftp = ftplib.FTP(p.netloc, timeout=10)
         ftp.login("anonymous", "")
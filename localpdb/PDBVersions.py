@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from localpdb.PDBVersioneer import PDBVersioneer
+from localpdb.utils.snapshot import load_pdb_data
+from localpdb.utils.seqres import SeqresStore
+
+
+class PDBVersions:
+    """
+    Parsed data of multiple localpdb versions. Each distinct entry and chain row is stored once (rows are matched by
+    their content) and every version is represented by the membership bitmap over the stored rows, therefore
+    loading several weekly releases costs little more memory than loading a single one. Sequences are stored once
+    for all versions as well (matched by the 'seq_id' hashes).
+    """
+
+    def __init__(self, db_path='', versions=None):
+        """
+        @param db_path (str): location of the localpdb database
+        @param versions (list): versions of the localpdb database to load (default: None - all installed versions)
+        """
+        self._pdbv = PDBVersioneer(db_path=db_path)
+        if len(self._pdbv.local_pdb_versions) == 0:
+            raise FileNotFoundError(f'localpdb is not setup in directory \'{db_path}\'!')
+        versions = self._pdbv.local_pdb_versions if versions is None else sorted(set(versions))
+        missing = [str(version) for version in versions if version not in self._pdbv.local_pdb_versions]
+        if len(missing) > 0:
+            raise ValueError(f'Versions \'{", ".join(missing)}\' are not available in the localpdb database!')
+        self.versions = versions
+
+        rows = {'entries': [], 'chains': []}  # Distinct rows added by each version
+        keys = {'entries': pd.Index([], dtype=np.uint64), 'chains': pd.Index([], dtype=np.uint64)}  # Row hashes
+        members = {'entries': [], 'chains': []}  # Positions of the stored rows present in each version
+        seqres, seq_ids = [], pd.Index([], dtype=np.uint64)  # Distinct sequences added by each version
+        for version in self.versions:
+            entries, chains, store = load_pdb_data(f'{self._pdbv.db_path}/data/{version}', lazy_sequences=True)
+            new = ~chains['seq_id'].duplicated().values & ~chains['seq_id'].isin(seq_ids).values
+            if new.any():
+                store = store.take(chains.index[new])
+                seqres.append(SeqresStore(chains['seq_id'].values[new], store.offsets, store.buffer))
+                seq_ids = seq_ids.append(pd.Index(chains['seq_id'].values[new]))
+            for name, df in [('entries', entries), ('chains', chains)]:
+                df_keys = pd.util.hash_pandas_object(df, index=True).values
+                new = ~pd.Index(df_keys).isin(keys[name])
+                rows[name].append(df[new])
+                keys[name] = keys[name].append(pd.Index(df_keys[new]))
+                members[name].append(keys[name].get_indexer(df_keys))
+
+        self._entries = pd.concat(rows['entries'])
+        self._chains = pd.concat(rows['chains'])
+        self._entries_membership = self.__membership_bitmap(members['entries'], len(self._entries))
+        self._chains_membership = self.__membership_bitmap(members['chains'], len(self._chains))
+        # Sequences shared by all versions, indexed by the sequence hashes ('seq_id' column)
+        self._seqres = SeqresStore.concat(seqres)
+
+    @staticmethod
+    def __membership_bitmap(members, n_rows):
+        """
+        @return: boolean array of shape (n_rows, n_versions), True if the row is present in the version
+        """
+        bitmap = np.zeros((n_rows, len(members)), dtype=bool)
+        for i, positions in enumerate(members):
+            bitmap[positions, i] = True
+        return bitmap
+
+    def __repr__(self):
+        return f'localpdb database versions ({", ".join(map(str, self.versions))}) holding {len(self._entries)} ' \
+               f'distinct entries ({len(self._chains)} distinct chains)'
+
+    def __version_idx(self, version):
+        try:
+            return self.versions.index(version)
+        except ValueError:
+            raise ValueError(f'Version \'{version}\' is not loaded!')
+
+    def entries(self, version):
+        """
+        @param version: localpdb version
+        @return: pd.DataFrame with the entries (lpdb.entries) of the given version
+        """
+        return self._entries[self._entries_membership[:, self.__version_idx(version)]]
+
+    def chains(self, version):
+        """
+        @param version: localpdb version
+        @return: pd.DataFrame with the chains (lpdb.chains, without the 'sequence' column) of the given version
+        """
+        return self._chains[self._chains_membership[:, self.__version_idx(version)]]
+
+    def get_sequences(self, version, ids=None):
+        """
+        @param version: localpdb version
+        @param ids: pdb_chain identifiers (default: None - all chains of the given version)
+        @return: pd.Series with sequences indexed by the pdb_chain identifiers
+        """
+        seq_ids = self.chains(version)['seq_id']
+        if ids is not None:
+            ids = pd.Index(ids)
+            missing = ids.difference(seq_ids.index)
+            if len(missing) > 0:
+                raise KeyError(f'Sequences of chains: {", ".join(missing[:5])} are not available!')
+            seq_ids = seq_ids.loc[ids]
+        return self._seqres.get(seq_ids.values).set_axis(seq_ids.index)
+
+    def compare(self, version_a, version_b, level='chains'):
+        """
+        Compares two loaded versions.
+        @param version_a: earlier localpdb version
+        @param version_b: later localpdb version
+        @param level: either 'entries' or 'chains'
+        @return: dict with the 'added', 'removed' and 'changed' (present in both versions, but with different data)
+        identifiers (pd.Index)
+        """
+        if level not in ['entries', 'chains']:
+            raise ValueError('\'level\' must be either \'entries\' or \'chains\'!')
+        df, bitmap = (self._entries, self._entries_membership) if level == 'entries' else \
+            (self._chains, self._chains_membership)
+        in_a, in_b = bitmap[:, self.__version_idx(version_a)], bitmap[:, self.__version_idx(version_b)]
+        ids_a, ids_b = df.index[in_a & ~in_b], df.index[in_b & ~in_a]
+        return {'added': ids_b.difference(ids_a), 'removed': ids_a.difference(ids_b),
+                'changed': ids_b.intersection(ids_a)}
@@ -1,3 +1,28 @@
-from .PDBVersioneer import PDBVersioneer
-from .PDBDownloader import PDBDownloader
-from .PDB import PDB
+import sys
+import importlib
+
+# Modules are imported on the first access so that 'import localpdb' does not pull in the heavy dependencies
+# (pandas, numpy, requests) until they are needed
+_lazy_imports = {'PDBVersioneer': '.PDBVersioneer',
+                 'PDBDownloader': '.PDBDownloader',
+                 'PDB': '.PDB',
+                 'PDBVersions': '.PDBVersions'}
+
+__all__ = list(_lazy_imports)
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        importlib.import_module(_lazy_imports[name], __name__)
+        # Importing a submodule binds its name in the package namespace to the module (modules are named after the
+        # classes they define), rebind the names of all imported submodules to the classes
+        for attr_name, module_name in _lazy_imports.items():
+            attr = getattr(sys.modules.get(f'{__name__}{module_name}'), attr_name, None)
+            if attr is not None:  # Submodule is imported (and fully initialized)
+                globals()[attr_name] = attr
+        return globals()[name]
+    raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -9,12 +9,12 @@ import tarfile
 import json
 import ftplib
 import importlib
-from tqdm import tqdm
 from pathlib import Path
 from localpdb import PDB, PDBVersioneer, PDBDownloader
 from localpdb.plugins import PluginVersioneer
 from localpdb.utils.os import create_directory, setup_logging_handlers, clean_exit
 from localpdb.utils.config import load_remote_source, Config
+from localpdb.utils.snapshot import load_pdb_data
 from localpdb.utils.errors import *
 
 # Setup logging
@@ -37,6 +37,9 @@ def get_params():
     parser.add_argument('--update', help='Update existing localpdb database', action='store_true')
     parser.add_argument('--fetch_pdb', help='Download the protein structures in the PDB format', action='store_true')
     parser.add_argument('--fetch_cif', help='Download the protein structures in the mmCIF format', action='store_true')
+    parser.add_argument('--refresh_metadata', '--refresh-metadata', dest='refresh_metadata',
+                        help='Ignore the cached remote metadata (e.g. the listing of the available PDB versions)',
+                        action='store_true')
     parser.add_argument('-tmp_path', help='Path to store the temporary installation files', default='/tmp/', metavar='TMP_PATH')
 
     # Add optional arguments to manually define PDB mirror (these options override the mirror definition from -mirror)
@@ -62,7 +65,7 @@ def get_params():
 
 def setup_versioneer(args):
     try:
-        pdbv = PDBVersioneer(db_path=args.db_path, config=args.remote_source)
+        pdbv = PDBVersioneer(db_path=args.db_path, config=args.remote_source, refresh_metadata=args.refresh_metadata)
         remote_ver = pdbv.current_remote_version
         return pdbv, remote_ver
     except (socket.timeout, ftplib.error_temp, socket.gaierror):
@@ -83,9 +86,9 @@ def download(args, mode='', clean=True, update=False, pdbv=None):
     if mode == 'files':
         with clean_exit(callback=args.pdbd.clean_unsuccessful):
             file_types = ['entries', 'entries_type', 'bundles', 'resolution', 'seqres', 'added', 'modified', 'obsolete']
-            for file_type in tqdm(file_types, unit='item'):
-                result = args.pdbd.download(file_type=file_type)
-                if not result:
+            results = args.pdbd.download_files(file_types)
+            for file_type in file_types:
+                if not results[file_type]:
                     logger.error(f'Failed to download file_type: \"{file_type}\"')
                     sys.exit(1)
             print()
@@ -136,6 +139,18 @@ def download(args, mode='', clean=True, update=False, pdbv=None):
     args.pdbd.remove_lock()
 
 
+def build_snapshot(args, version, incremental=False):
+    """
+    Parses the raw PDB files of the given version and stores the snapshot used by localpdb.PDB
+    If incremental is set the snapshot is built from the snapshot of the previous local version and the weekly changes.
+    """
+    print()
+    logger.info(f'Building the data snapshot for the localpdb version: \'{version}\'...')
+    prev_versions = [ver for ver in PDBVersioneer(db_path=args.db_path).local_pdb_versions if ver < version]
+    prev_working_path = f'{args.db_path}/data/{max(prev_versions)}' if incremental and prev_versions else None
+    load_pdb_data(f'{args.db_path}/data/{version}', rebuild=True, prev_working_path=prev_working_path)
+
+
 def install_plugins(args):
     pdbv, args.remote_version = setup_versioneer(args)
     config = Config(args.db_path / 'config.yml')
@@ -329,6 +344,7 @@ def main():
                                                    else args.remote_version if args.fetch_cif else None})
                 config.commit()
                 logger.info(f'Successfully synced protein structures in the \'mmCIF\' format!')
+        build_snapshot(args, conf_dict['init_ver'])
 
     # localpdb is set up and up to date
     elif args.remote_version == pdbv.current_local_version:
@@ -380,6 +396,7 @@ def main():
             if config['struct_mirror']['cif']:
                 download(args, mode='rsync_cif', clean=True, update=True)
             pdbv.update_logs()
+            build_snapshot(args, args.pdbd.version, incremental=True)
             print()
             logger.info(
                 f'Successfully updated localpdb in \'{args.db_path}\' to version \'{pdbv.current_remote_version}\'!')
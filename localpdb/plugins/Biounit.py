@@ -1,7 +1,7 @@
 import logging
 import os
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
 from localpdb.utils.network import download_url
 
@@ -17,9 +17,9 @@ class Biounit(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0] # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
     ###########################################################
     ### End of the part required for proper plugin handling ###
 
@@ -1,16 +1,15 @@
 import logging
 import os
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
-from localpdb.utils.network import download_url
+from localpdb.utils.network import download_url, PARTIAL_DIR
 
 logger = logging.getLogger(__name__)
 
 # Plugin specific imports
 import pandas as pd
 import urllib.request
-from bs4 import BeautifulSoup
 
 
 class ECOD(Plugin):
@@ -18,9 +17,9 @@ class ECOD(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0] # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
     ###########################################################
     ### End of the part required for proper plugin handling ###
 
@@ -54,12 +53,14 @@ class ECOD(Plugin):
     def _setup(self):
         try:
             local_fn = str(self.plugin_dir) + '/data/ecod_domains_{}.txt'.format(self.plugin_version)
-            download_url(self.history[self.plugin_version], local_fn)
+            download_url(self.history[self.plugin_version], local_fn,
+                         partial_dir=f'{self.lpdb.db_path}/{PARTIAL_DIR}')
         except:
             raise PluginInstallError()
 
     def _get_historical_versions(self):
         # Fetch ECOD history
+        from bs4 import BeautifulSoup
         ecod_content = urllib.request.urlopen(self.plugin_config['ecod_url'])
         soup = BeautifulSoup(ecod_content, "html.parser")
         ecod_history = {}
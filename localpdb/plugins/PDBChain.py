@@ -1,7 +1,7 @@
 import logging
 import os
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
 from localpdb.utils.network import download_url
 
@@ -11,9 +11,6 @@ logger = logging.getLogger(__name__)
 import gzip
 import shutil
 from localpdb.utils.os import multiprocess, os_cmd
-from Bio.PDB import Select
-from Bio.PDB.PDBParser import PDBParser
-from Bio.PDB import PDBIO
 
 
 class PDBChain(Plugin):
@@ -21,9 +18,9 @@ class PDBChain(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0] # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
     ###########################################################
     ### End of the part required for proper plugin handling ###
 
@@ -81,29 +78,36 @@ class PDBChain(Plugin):
         for pdb_id in pdb_ids:
             create_directory(f'{self.plugin_dir}/{pdb_id}')
 
-class SelectChains(Select):
+def select_chains(chain_letters):
     """ Only accept the specified chains when saving. """
+    from Bio.PDB import Select
 
-    def __init__(self, chain_letters):
-        self.chain_letters = chain_letters
+    class SelectChains(Select):
 
-    def accept_atom(self, atom):
-        if (not atom.is_disordered()) or atom.get_altloc() == 'A' or atom.get_altloc() == '1':
-            atom.set_altloc(' ')  # Eliminate alt location ID before output.
-            return True
-        else:  # Alt location was not one to be output.
-            return False
+        def __init__(self, chain_letters):
+            self.chain_letters = chain_letters
 
-    def accept_chain(self, chain):
-        return chain.get_id() in self.chain_letters
+        def accept_atom(self, atom):
+            if (not atom.is_disordered()) or atom.get_altloc() == 'A' or atom.get_altloc() == '1':
+                atom.set_altloc(' ')  # Eliminate alt location ID before output.
+                return True
+            else:  # Alt location was not one to be output.
+                return False
+
+        def accept_chain(self, chain):
+            return chain.get_id() in self.chain_letters
+
+    return SelectChains(chain_letters)
 
 def extract_chain(args):
+    from Bio.PDB import PDBIO
+    from Bio.PDB.PDBParser import PDBParser
     in_fn, chain, out_fn = args
     parser = PDBParser(QUIET=True)
     writer = PDBIO()
     with gzip.open(in_fn, 'rt') as f:
         struct = parser.get_structure('A', f)
     writer.set_structure(struct)
-    writer.save(out_fn, select=SelectChains(chain))
+    writer.save(out_fn, select=select_chains(chain))
     result = os.system(f'gzip -f {out_fn}')
     return result, None
\ No newline at end of file
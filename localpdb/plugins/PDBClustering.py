@@ -1,13 +1,11 @@
 import logging
 import os
-import requests
 import json
 import numpy as np
-from tqdm import tqdm
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
-from localpdb.utils.network import download_url
+from localpdb.utils.network import download_url, PARTIAL_DIR
 
 logger = logging.getLogger(__name__)
 
@@ -19,9 +17,9 @@ class PDBClustering(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0] # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
     ###########################################################
     ### End of the part required for proper plugin handling ###
 
@@ -36,11 +34,12 @@ class PDBClustering(Plugin):
         create_directory(f'{self.plugin_dir}/{self.plugin_version}')
 
     def _setup(self):
+        from tqdm import tqdm
         clust_redundancy = [30, 40, 50, 70, 90, 95, 100]
         for redundancy in clust_redundancy:
             local_fn = f'{self.plugin_dir}/{self.plugin_version}/bc-{redundancy}.out'
             url = self.plugin_config['clust_url'] + f'clusters-by-entity-{redundancy}.txt'
-            download_url(url, local_fn)
+            download_url(url, local_fn, partial_dir=f'{self.lpdb.db_path}/{PARTIAL_DIR}')
 
         entity_instance_mapping = {}
         local_fn = f'{self.plugin_dir}/{self.plugin_version}/mapping.json'
@@ -73,6 +72,7 @@ class PDBClustering(Plugin):
 
 
 def fetch_entity_instance_mapping(entries):
+    import requests
     query = """{entries(entry_ids: %s) {polymer_entities {rcsb_id, rcsb_polymer_entity_container_identifiers {auth_asym_ids}}}}""" % json.dumps(
         list(entries))
     res = requests.post("https://data.rcsb.org/graphql", json={"query": query}).json()['data']['entries']
@@ -2,7 +2,7 @@ import logging
 import warnings
 import os
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
 from localpdb.utils.network import download_url
 
@@ -18,9 +18,9 @@ class PDBSeqresMapper(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0]  # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
 
     ###########################################################
     ### End of the part required for proper plugin handling ###
@@ -86,7 +86,7 @@ class PDBSeqresMapper(Plugin):
             raise ValueError('Mapping for id \'{}\' is not available!'.format(pdb_chain_id))
 
         mapping_dict = self.get_pdbseqres_mapping(pdb_chain_id)
-        seqres_seq = self.lpdb.chains.loc[pdb_chain_id, 'sequence']
+        seqres_seq = self.lpdb.get_sequences([pdb_chain_id]).iloc[0]
         mapping = [na_value] * len(seqres_seq)
 
         for key, value in value_dict.items():
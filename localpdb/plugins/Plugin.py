@@ -2,7 +2,6 @@ import warnings
 import logging
 import shutil
 import os
-from jinja2 import Environment, BaseLoader
 from .PluginVersioneer import PluginVersioneer
 from localpdb.utils.os import create_directory, custom_warning
 from localpdb.utils.errors import *
@@ -169,4 +168,5 @@ class Plugin:
         create_directory(f'{self.plugin_dir}/data')
 
     def _render_template(self, param_dict={}):
+        from jinja2 import Environment, BaseLoader
         return [Environment(loader=BaseLoader).from_string(template).render(param_dict) for template in self.fn_template]
@@ -1,9 +1,9 @@
 import logging
 import os
 from .Plugin import Plugin
-from localpdb.utils.config import Config
+from localpdb.utils.config import LazyConfig
 from localpdb.utils.os import create_directory
-from localpdb.utils.network import download_url
+from localpdb.utils.network import download_url, PARTIAL_DIR
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +18,9 @@ class SIFTS(Plugin):
     ### Beginning of the part required for proper plugin handling ###
     #################################################################
     plugin_name = os.path.basename(__file__).split('.')[0] # Name of the plugin based on the filename
-    plugin_config = Config(
-        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml').data  # Plugin config (dict)
-    plugin_dir = plugin_config['path']
+    plugin_config = LazyConfig(
+        f'{os.path.dirname(os.path.realpath(__file__))}/config/{plugin_name}.yml')  # Plugin config (dict), read on first access
+    plugin_dir = plugin_config.item('path')
     ###########################################################
     ### End of the part required for proper plugin handling ###
 
@@ -97,7 +97,7 @@ class SIFTS(Plugin):
         out_dir = f'{self.plugin_dir}/{self.plugin_version}/'
         for name, url in self.plugin_config['urls'].items():
             out_fn = '{}/{}'.format(out_dir, os.path.basename(urlparse(url).path))
-            download_url(url, out_fn, ftp=True)
+            download_url(url, out_fn, ftp=True, partial_dir=f'{self.lpdb.db_path}/{PARTIAL_DIR}')
 
     def _filter_chains(self, chains):
         self.lpdb.pfam = self.lpdb.pfam[self.lpdb.pfam['pdb_chain'].isin(chains)]
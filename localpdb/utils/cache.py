@@ -0,0 +1,76 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+METADATA_CACHE_FN = '.metadata_cache.json'  # Cached remote metadata (stored in the localpdb directory)
+
+_memo = {}  # In-process memo - {key: (fetch time, value, fetched in this process)}
+
+
+class MetadataCache:
+    """
+    Cache of the remote metadata (e.g. listing of the available PDB versions) with the explicit expiration times.
+    Values are memoized in the process and persisted in the JSON file, so each remote source is queried at most once
+    per run and once per TTL across the runs.
+    """
+
+    def __init__(self, fn=None, refresh=False):
+        """
+        @param fn: filename of the cache (default: None - values are memoized only in the current process)
+        @param refresh: if True values cached on disk or read from disk in this process are ignored and fetched again
+        """
+        self.fn = str(fn) if fn is not None else None
+        self.refresh = refresh
+
+    def get(self, key, fetch, ttl):
+        """
+        Returns the cached value or fetches and caches it if missing or expired
+        @param key: key of the value
+        @param fetch: function (without arguments) returning the value (must be JSON serializable)
+        @param ttl: time (s) after which the cached value expires
+        @return: value
+        """
+        now = time.time()
+        cached = _memo.get(key)
+        if cached is not None and now - cached[0] < ttl and (cached[2] or not self.refresh):
+            return cached[1]
+        if not self.refresh:
+            entry = self.__read().get(key)
+            if entry is not None and now - entry['time'] < ttl:
+                _memo[key] = (entry['time'], entry['value'], False)
+                return entry['value']
+        value = fetch()
+        _memo[key] = (now, value, True)
+        self.__write(key, {'time': now, 'value': value})
+        return value
+
+    def __read(self):
+        """
+        Reads the cache file, missing or corrupted file is treated as empty
+        """
+        if self.fn is None:
+            return {}
+        try:
+            with open(self.fn) as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def __write(self, key, entry):
+        """
+        Updates the entry in the cache file (written only if the directory exists)
+        """
+        if self.fn is None or not os.path.isdir(os.path.dirname(self.fn)):
+            return
+        data = self.__read()
+        data[key] = entry
+        try:
+            tmp_fn = f'{self.fn}.{os.getpid()}.tmp'
+            with open(tmp_fn, 'w') as f:
+                f.write(json.dumps(data))
+            os.replace(tmp_fn, self.fn)
+        except OSError as e:
+            logger.debug(f'Could not write the metadata cache \'{self.fn}\': {e}')
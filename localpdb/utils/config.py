@@ -16,6 +16,38 @@ class Config:
             yaml.dump(self.data, f, default_flow_style=False)
 
 
+class LazyConfig:
+    """
+    Descriptor reading the config file on the first access instead of at import time (used for the plugin configs).
+    """
+
+    def __init__(self, fn):
+        self.config_fn = fn
+        self.data = None
+
+    def __get__(self, obj, objtype=None):
+        if self.data is None:
+            self.data = Config(self.config_fn).data
+        return self.data
+
+    def item(self, key):
+        """
+        @param key: key of the config
+        @return: descriptor returning the value of the key on the first access
+        """
+        return LazyConfigItem(self, key)
+
+
+class LazyConfigItem:
+
+    def __init__(self, config, key):
+        self.config = config
+        self.key = key
+
+    def __get__(self, obj, objtype=None):
+        return self.config.__get__(obj, objtype)[self.key]
+
+
 def load_remote_source(mirror=''):
     """
     Loads config file with definition of the remote data sources and formats it according to the chosen mirror.
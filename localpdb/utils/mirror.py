@@ -0,0 +1,84 @@
+import os
+import time
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def get_manifest_fn(db_path, format):
+    """
+    @param db_path: localpdb database path
+    @param format: structure files format ('pdb' or 'mmCIF')
+    @return: filename of the mirror manifest
+    """
+    return f'{db_path}/mirror/{format}_manifest.txt'
+
+
+def build_manifest(db_path, format):
+    """
+    Lists structure files present in the mirror (single os.scandir walk) and stores them in the manifest file.
+    Manifest modification time is set to the start of the walk so that any change made during the walk marks it as
+    outdated.
+    @param db_path: localpdb database path
+    @param format: structure files format ('pdb' or 'mmCIF')
+    @return: pd.Index with paths of the structure files relative to the mirror directory (e.g. 'ab/1abc.cif.gz')
+    """
+    start = time.time()
+    fns = []
+    try:
+        with os.scandir(f'{db_path}/mirror/{format}') as it:
+            for sub_dir in it:
+                if sub_dir.is_dir():
+                    with os.scandir(sub_dir.path) as sub_it:
+                        fns.extend(f'{sub_dir.name}/{entry.name}' for entry in sub_it if entry.is_file())
+    except FileNotFoundError:
+        return pd.Index([], dtype=object)
+    fns.sort()
+    manifest_fn = get_manifest_fn(db_path, format)
+    try:
+        with open(f'{manifest_fn}.tmp', 'w') as f:
+            f.write(''.join(f'{fn}\n' for fn in fns))
+        os.utime(f'{manifest_fn}.tmp', (start, start))
+        os.replace(f'{manifest_fn}.tmp', manifest_fn)
+        logger.debug(f'Written manifest of {len(fns)} files in the \'{format}\' mirror.')
+    except OSError:
+        logger.debug(f'Could not write manifest of the \'{format}\' mirror.')
+    return pd.Index(fns, dtype=object)
+
+
+def is_manifest_outdated(db_path, format):
+    """
+    Checks whether the mirror was modified after the manifest was built. Only the directories are checked (one stat
+    per sub-directory) since adding, removing or renaming a file changes the modification time of its directory.
+    Files replaced in place are not detected and rsync with the '-t' (or '-a') option sets the modification times of
+    the directories to the remote ones - the check covers the manual changes of the mirror only, PDBDownloader
+    rebuilds the manifest (build_manifest) after every rsync run.
+    @param db_path: localpdb database path
+    @param format: structure files format ('pdb' or 'mmCIF')
+    @return: True if manifest is missing or outdated
+    """
+    try:
+        manifest_mtime = os.stat(get_manifest_fn(db_path, format)).st_mtime
+    except FileNotFoundError:
+        return True
+    try:
+        with os.scandir(f'{db_path}/mirror/{format}') as it:
+            if os.stat(f'{db_path}/mirror/{format}').st_mtime >= manifest_mtime:
+                return True
+            return any(sub_dir.stat().st_mtime >= manifest_mtime for sub_dir in it if sub_dir.is_dir())
+    except FileNotFoundError:
+        return True
+
+
+def load_manifest(db_path, format):
+    """
+    Loads the manifest of the structure files mirror, manifest is rebuilt if it is missing or outdated.
+    @param db_path: localpdb database path
+    @param format: structure files format ('pdb' or 'mmCIF')
+    @return: pd.Index with paths of the structure files relative to the mirror directory (e.g. 'ab/1abc.cif.gz')
+    """
+    if is_manifest_outdated(db_path, format):
+        return build_manifest(db_path, format)
+    with open(get_manifest_fn(db_path, format)) as f:
+        return pd.Index(f.read().split(), dtype=object)
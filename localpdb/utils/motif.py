@@ -0,0 +1,117 @@
+import re
+import concurrent.futures
+import pandas as pd
+
+prosite_element_re = re.compile(r'^(?P<residues>[A-Za-z]|\[[A-Z<>]+\]|\{[A-Z]+\})(?:\((?P<min>\d+)(?:,(?P<max>\d+))?\))?$')
+
+
+def prosite_to_regex(pattern):
+    """
+    Compiles the PROSITE pattern to the regular expression, e.g. '<M-x(2,4)-[LIVM]-{P}-H.' -> '^M.{2,4}[LIVM][^P]H'
+    @param pattern: PROSITE pattern
+    @return: regular expression (str)
+    """
+    elements = pattern.strip().rstrip('.').split('-')
+    regex = []
+    for i, element in enumerate(elements):
+        prefix, suffix = '', ''
+        if i == 0 and element.startswith('<'):
+            element, prefix = element[1:], '^'
+        if i == len(elements) - 1 and element.endswith('>'):
+            element, suffix = element[:-1], '$'
+        match = prosite_element_re.match(element)
+        if match is None:
+            raise ValueError(f'Invalid element \'{element}\' of the PROSITE pattern \'{pattern}\'!')
+        residues = match.group('residues')
+        if residues in ('x', 'X'):
+            residues = '.'
+        elif residues.startswith('{'):
+            residues = f'[^{residues[1:-1]}]'
+        elif residues.startswith('['):
+            # Termini inside the brackets, e.g. '[G>]' - either 'G' or the C-terminus
+            chars = residues[1:-1].replace('<', '').replace('>', '')
+            alternatives = (['^'] if '<' in residues else []) + (['$'] if '>' in residues else []) + \
+                ([f'[{chars}]'] if chars else [])
+            residues = f'(?:{"|".join(alternatives)})' if len(alternatives) > 1 or not chars else alternatives[0]
+        else:
+            residues = residues.upper()
+        if match.group('max') is not None:
+            residues += f'{{{match.group("min")},{match.group("max")}}}'
+        elif match.group('min') is not None:
+            residues += f'{{{match.group("min")}}}'
+        regex.append(f'{prefix}{residues}{suffix}')
+    return ''.join(regex)
+
+
+def compile_motifs(motifs, type_='prosite'):
+    """
+    Converts the motifs to the regular expressions
+    @param motifs: list of motifs
+    @param type_: type of the motifs - 'prosite' (e.g. 'C-x-C-x(2)-[LIVMYFWC]'), 'simple' (e.g. 'CXCXXL') or 'regex'
+    (e.g. 'CXCX{2}[LIVMYFWC]', 'X' matches any residue)
+    @return: list of regular expressions (str)
+    """
+    if type_ == 'prosite':
+        regexes = [prosite_to_regex(motif) for motif in motifs]
+    elif type_ in ['simple', 'regex']:
+        regexes = [motif.replace('X', '.') for motif in motifs]
+    else:
+        raise ValueError('\'type_\' must be either \'prosite\', \'simple\' or \'regex\'!')
+    for motif, regex in zip(motifs, regexes):
+        try:
+            re.compile(regex)
+        except re.error as e:
+            raise ValueError(f'Invalid motif \'{motif}\': {e}')
+    return regexes
+
+
+def scan_chunk(args):
+    """
+    Finds the occurrences of the motifs in the sequences. Motifs are combined into the single regular expression (the
+    alternation of lookaheads), so each sequence is scanned once for all motifs. At each position the first matching
+    motif is reported by the combined expression and only the motifs following it are checked at that position.
+    Inputs are wrapped to the tuple for multiprocessing.
+    @param args: (ids, sequences, regexes) tuple
+    @return: list of the (pdb_chain, motif index, start, end) tuples (0-based start, end is exclusive)
+    """
+    ids, sequences, regexes = args
+    patterns = [re.compile(regex) for regex in regexes]
+    combined = re.compile('|'.join(f'(?=(?P<motif{i}>{regex}))' for i, regex in enumerate(regexes)))
+    hits = []
+    for pdb_chain, sequence in zip(ids, sequences):
+        for match in combined.finditer(sequence):
+            start = match.start()
+            first = next(i for i in range(len(regexes)) if match.start(f'motif{i}') != -1)
+            hits.append((pdb_chain, first, start, match.end(f'motif{first}')))
+            for i in range(first + 1, len(patterns)):
+                other = patterns[i].match(sequence, start)
+                if other is not None:
+                    hits.append((pdb_chain, i, start, other.end()))
+    return hits
+
+
+def scan_motifs(sequences, motifs, type_='prosite', np=None, chunk_size=10000):
+    """
+    Scans the sequences for the occurrences of the motifs. Sequences are split into chunks scanned in parallel by
+    the worker processes.
+    @param sequences: pd.Series with sequences indexed by the pdb_chain identifiers
+    @param motifs: list of motifs
+    @param type_: type of the motifs (see compile_motifs)
+    @param np: number of processes (default: None - number of CPUs, 1 - scan in the current process)
+    @param chunk_size: number of sequences scanned by the single job
+    @return: pd.DataFrame with the 'pdb_chain', 'motif', 'start' and 'end' (1-based, inclusive) of each occurrence
+    """
+    regexes = compile_motifs(motifs, type_=type_)
+    ids, sequences = sequences.index.tolist(), sequences.tolist()
+    chunks = [(ids[i:i + chunk_size], sequences[i:i + chunk_size], regexes)
+              for i in range(0, len(ids), chunk_size)]
+    if np == 1 or len(chunks) <= 1:
+        results = [scan_chunk(chunk) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=np) as executor:
+            results = list(executor.map(scan_chunk, chunks))
+    hits = pd.DataFrame([hit for result in results for hit in result],
+                        columns=['pdb_chain', 'motif', 'start', 'end'])
+    hits['motif'] = pd.Series(motifs, dtype=object).iloc[hits['motif']].values
+    hits['start'] += 1
+    return hits
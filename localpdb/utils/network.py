@@ -1,7 +1,13 @@
+import os
 import logging
-import urllib.request
+import json
+import shutil
+import hashlib
+import threading
 import urllib.error
 import time
+import http.client
+import ftplib
 from ftplib import FTP
 from urllib.parse import urlparse
 from datetime import datetime
@@ -10,6 +16,41 @@ from localpdb.utils.os import set_last_modified
 logger = logging.getLogger(__name__)
 
 
+HTTP_TIMEOUT = 60  # Timeout (s) of the HTTP connection and reads
+LAST_MODIFIED_FMT = '%a, %d %b %Y %H:%M:%S %Z'
+PARTIAL_DIR = '.partial'  # Directory (in the localpdb directory) storing the partial files of the interrupted downloads
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the HTTP session shared by the downloads of the process (connections are pooled and reused)
+    @return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+def parse_mdtm(ts):
+    """
+    Converts the FTP 'MDTM' response to the timestamp
+    """
+    last_modified = '{yy}-{mo}-{dd} {hh}:{mm}:{ss}'.format(yy=ts[:4], mo=ts[4:6], dd=ts[6:8], hh=ts[8:10],
+                                                           mm=ts[10:12], ss=ts[12:14])
+    last_modified = datetime.strptime(last_modified, '%Y-%m-%d %H:%M:%S')
+    return time.mktime(last_modified.timetuple())
+
+
 def get_last_modified(url, ftp=False):
     """
     Fetches the 'Last-Modified' value of the remote URL
@@ -23,32 +64,193 @@ def get_last_modified(url, ftp=False):
         ftp.login()
         ts = ftp.voidcmd("MDTM {}".format(parsed_url.path))[4:].strip()
         ftp.close()
-        last_modified = '{yy}-{mo}-{dd} {hh}:{mm}:{ss}'.format(yy=ts[:4], mo=ts[4:6], dd=ts[6:8], hh=ts[8:10],
-                                                               mm=ts[10:12], ss=ts[12:14])
-        last_modified = datetime.strptime(last_modified, '%Y-%m-%d %H:%M:%S')
-        return time.mktime(last_modified.timetuple())
+        return parse_mdtm(ts)
     else:
-        conn = urllib.request.urlopen(url, timeout=30)
-        last_modified = time.strptime(conn.headers['last-modified'], '%a, %d %b %Y %H:%M:%S %Z')
-        conn.close()
-        return time.mktime(last_modified)
+        r = get_session().head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+        return time.mktime(time.strptime(r.headers['last-modified'], LAST_MODIFIED_FMT))
 
 
-def download_url(url, dest, ftp=False):
+def download_url(url, dest, ftp=False, retries=0, backoff=2, partial_dir=None):
     """
-    Method for handling downloads and replicating modification timestamps
+    Method for handling downloads and replicating modification timestamps. File is written to the partial file moved
+    to the destination once complete, interrupted downloads are resumed (HTTP 'Range' or FTP 'REST') by the retries
+    and subsequent calls as long as the remote file is unchanged. If the destination exists it is downloaded only if
+    the remote file was modified (i.e. its 'Last-Modified' date differs from the modification date of the local file).
     @param url: url to download
     @param dest: destination of the downloaded file
     @param ftp: True if ftp protocol is used for downloads.
+    @param retries: number of retries after the failed download (client errors, e.g. 404, are not retried)
+    @param backoff: delay (s) before the first retry, doubled with each subsequent retry
+    @param partial_dir: directory storing the partial files (default: None - destination directory)
     @return True/False denoting whether download was successful or not
     """
-    try:
-        urllib.request.urlretrieve(url, dest)
-        logger.debug(f'Downloaded url: \'{url}\' to destination: \'{dest}\'')
-        # Set remote 'last-modified' date for verification purposes
-        last_modified = get_last_modified(url, ftp=ftp)
-        set_last_modified(dest, last_modified)
-        return True
-    except (urllib.error.URLError, urllib.error.HTTPError):
-        logger.error(f'Failed to download url: \'{url}\' to destination: \'{dest}\'')
-        return False
+    partial = PartialDownload(url, dest, partial_dir=partial_dir)
+    for attempt in range(retries + 1):
+        try:
+            if ftp or url.startswith('ftp://'):
+                downloaded = _download_ftp(url, dest, partial)
+            else:
+                downloaded = _download_http(url, dest, partial)
+            if downloaded:
+                logger.debug(f'Downloaded url: \'{url}\' to destination: \'{dest}\'')
+            else:
+                logger.debug(f'Skipped url: \'{url}\' - destination \'{dest}\' is up to date')
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code < 500 or attempt == retries:
+                break
+            error = e
+        except (OSError, EOFError, http.client.HTTPException, ftplib.Error) as e:
+            if attempt == retries:
+                break
+            error = e
+        delay = backoff * 2 ** attempt
+        logger.debug(f'Failed to download url: \'{url}\' ({error}), retrying in {delay} s...')
+        time.sleep(delay)
+    logger.error(f'Failed to download url: \'{url}\' to destination: \'{dest}\'')
+    return False
+
+
+class PartialDownload:
+    """
+    Partial file of the interrupted download. Sidecar JSON file records the url, expected size and validator
+    (ETag or 'Last-Modified' date) of the remote file, the download is resumed only if they match.
+    """
+
+    def __init__(self, url, dest, partial_dir=None):
+        """
+        @param url: url to download
+        @param dest: destination of the downloaded file
+        @param partial_dir: directory storing the partial files (default: None - destination directory)
+        """
+        dest = os.path.abspath(dest)
+        partial_dir = os.path.dirname(dest) if partial_dir is None else str(partial_dir)
+        name = f'.{os.path.basename(dest)}.{hashlib.sha1(dest.encode()).hexdigest()[:12]}'
+        self.url = url
+        self.fn = f'{partial_dir}/{name}.partial'
+        self.meta_fn = f'{partial_dir}/{name}.partial.json'
+        self.meta = None
+
+    def resume_offset(self, validator=None, size=None):
+        """
+        @param validator: current validator of the remote file (default: None - not known before the request)
+        @param size: current size of the remote file (default: None - not known before the request)
+        @return: size of the partial file if the download can be resumed, else 0 (partial file is discarded)
+        """
+        try:
+            with open(self.meta_fn) as f:
+                meta = json.loads(f.read())
+            offset = os.path.getsize(self.fn)
+        except (OSError, ValueError):
+            self.discard()
+            return 0
+        if meta['url'] != self.url or meta['validator'] is None or \
+                (validator is not None and meta['validator'] != validator) or \
+                (size is not None and meta['size'] != size) or (meta['size'] is not None and offset >= meta['size']):
+            self.discard()
+            return 0
+        self.meta = meta
+        return offset
+
+    def start(self, size, validator):
+        """
+        Starts the new partial file
+        @param size: expected size of the file (None if not known)
+        @param validator: validator of the remote file (None if the remote server does not provide it)
+        """
+        os.makedirs(os.path.dirname(self.fn), exist_ok=True)
+        self.meta = {'url': self.url, 'size': size, 'validator': validator}
+        with open(self.meta_fn, 'w') as f:
+            f.write(json.dumps(self.meta))
+
+    def complete(self, dest):
+        """
+        Moves the complete partial file to the destination. Incomplete file is kept (to be resumed) and the file
+        larger than expected is discarded.
+        @param dest: destination of the downloaded file
+        """
+        size = os.path.getsize(self.fn)
+        if self.meta['size'] is not None and size != self.meta['size']:
+            if size > self.meta['size']:
+                self.discard()
+            raise IOError(f'Downloaded {size} of {self.meta["size"]} bytes of the url: \'{self.url}\'')
+        shutil.move(self.fn, dest)
+        os.remove(self.meta_fn)
+
+    def discard(self):
+        for fn in (self.fn, self.meta_fn):
+            try:
+                os.remove(fn)
+            except FileNotFoundError:
+                pass
+
+
+def _download_http(url, dest, partial):
+    """
+    Downloads the HTTP(S) url. Partial download is resumed with the 'Range' request (conditional on the remote file
+    being unchanged - 'If-Range'), otherwise the request is conditional on the modification date of the existing
+    destination ('If-Modified-Since'). 'Last-Modified' date is read from the same response.
+    @return: True if the file was downloaded, False if the destination is up to date
+    """
+    headers = {'Accept-Encoding': 'identity'}  # Byte ranges refer to the file content
+    offset = partial.resume_offset()
+    if offset > 0:
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = partial.meta['validator']
+    elif os.path.isfile(dest):
+        headers['If-Modified-Since'] = time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                                                     time.localtime(os.path.getmtime(dest)))
+    with get_session().get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as r:
+        if r.status_code == 304:
+            return False
+        if r.status_code == 416 or (r.status_code == 206 and
+                                    not r.headers.get('content-range', '').startswith(f'bytes {offset}-')):
+            partial.discard()  # Partial file does not match the remote file
+            return _download_http(url, dest, partial)
+        if r.status_code >= 400:
+            raise urllib.error.HTTPError(url, r.status_code, r.reason, r.headers, None)
+        if r.status_code == 206:
+            logger.debug(f'Resuming download of the url: \'{url}\' from byte {offset}')
+            mode = 'ab'
+        else:
+            etag = r.headers.get('etag')
+            validator = etag if etag is not None and not etag.startswith('W/') else r.headers.get('last-modified')
+            size = r.headers.get('content-length')
+            partial.start(int(size) if size is not None else None, validator)
+            mode = 'wb'
+        with open(partial.fn, mode) as f:
+            for chunk in r.iter_content(chunk_size=2**16):
+                f.write(chunk)
+        partial.complete(dest)
+        last_modified = r.headers.get('last-modified')
+        if last_modified is not None:
+            set_last_modified(dest, time.mktime(time.strptime(last_modified, LAST_MODIFIED_FMT)))
+    return True
+
+
+def _download_ftp(url, dest, partial):
+    """
+    Downloads the FTP url, the modification date ('MDTM') and size of the remote file are checked in the same session
+    and the transfer is skipped if they match the existing destination. Partial download is resumed ('REST') if the
+    remote file is unchanged.
+    @return: True if the file was downloaded, False if the destination is up to date
+    """
+    parsed_url = urlparse(url)
+    with FTP(parsed_url.netloc, timeout=HTTP_TIMEOUT) as ftp:
+        ftp.login()
+        ftp.voidcmd('TYPE I')
+        mdtm = ftp.voidcmd(f'MDTM {parsed_url.path}')[4:].strip()
+        last_modified, size = parse_mdtm(mdtm), ftp.size(parsed_url.path)
+        if os.path.isfile(dest) and os.path.getmtime(dest) == last_modified and os.path.getsize(dest) == size:
+            return False
+        offset = partial.resume_offset(validator=mdtm, size=size)
+        if offset > 0:
+            logger.debug(f'Resuming download of the url: \'{url}\' from byte {offset}')
+        else:
+            partial.start(size, mdtm)
+        with open(partial.fn, 'ab' if offset > 0 else 'wb') as f:
+            ftp.retrbinary(f'RETR {parsed_url.path}', f.write, rest=offset if offset > 0 else None)
+    partial.complete(dest)
+    set_last_modified(dest, last_modified)
+    return True
@@ -7,6 +7,10 @@ import signal
 import shlex
 import subprocess
 import concurrent.futures
+import multiprocessing
+import time
+import collections
+import itertools
 import tempfile
 import gzip
 from datetime import datetime
@@ -166,6 +170,113 @@ def multiprocess(func, cmd_dict, np=None, return_type='', print_progress=True, o
     elif return_type == 'all':
         return results
 
+_shared_job = None  # Function and DataFrame inherited by the forked worker processes (see map_chunks)
+
+
+def _map_chunk(args):
+    """
+    Applies the function to the rows of the DataFrame chunk. Inputs are wrapped to the tuple for multiprocessing.
+    :param args: (func, df, start, end) tuple - func and df are None if inherited from the parent process
+    :return: list of 'func' outputs (None if the chunk failed), error message and time spent on the chunk
+    """
+    func, df, start, end = args
+    if func is None:
+        func, df = _shared_job
+    start_time = time.perf_counter()
+    try:
+        results, error = [func(row) for row in df.iloc[start:end].itertuples()], None
+    except Exception as e:
+        results, error = None, f'{type(e).__name__}: {e}'
+    return results, error, time.perf_counter() - start_time
+
+
+def map_chunks(func, df, np=None, chunksize=1000, print_progress=True):
+    """
+    Applies the function to each row of the DataFrame in the process pool. Rows are processed in chunks - on
+    platforms supporting the 'fork' start method workers inherit the DataFrame and the function (only the chunk
+    bounds are sent to the workers), otherwise chunks are pickled.
+    :param func: function to apply, called with the row namedtuple (see pd.DataFrame.itertuples)
+    :param df: pd.DataFrame
+    :param np: number of processes
+    :param chunksize: number of rows processed by the single job
+    :param print_progress: print simple progress bar
+    :return: pd.Series with 'func' outputs indexed as df (rows of the failed chunks are set to None), per-chunk report
+    ('start', 'end', 'time' and 'error') is available in the 'chunks' attribute (series.attrs['chunks'])
+    """
+    import pandas as pd
+    global _shared_job
+    bounds = [(start, min(start + chunksize, len(df))) for start in range(0, len(df), chunksize)]
+    fork = 'fork' in multiprocessing.get_all_start_methods()
+    results, report = [None] * len(bounds), [None] * len(bounds)
+    _shared_job = (func, df) if fork else None
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=np, mp_context=multiprocessing.get_context('fork') if fork else None) as executor:
+            futures = {executor.submit(_map_chunk, (None, None, start, end) if fork else
+                                       (func, df.iloc[start:end], 0, end - start)): i
+                       for i, (start, end) in enumerate(bounds)}
+            for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                i = futures[future]
+                try:
+                    results[i], error, elapsed = future.result()
+                except Exception as e:  # e.g. worker was killed or outputs could not be pickled
+                    error, elapsed = f'{type(e).__name__}: {e}', None
+                if error is not None:
+                    logger.warning(f'Chunk {i} (rows {bounds[i][0]}-{bounds[i][1]}) failed - {error}')
+                report[i] = (*bounds[i], elapsed, error)
+                if print_progress:
+                    sys.stdout.write("\r%s/%s" % (count, len(bounds)))
+                    sys.stdout.flush()
+    finally:
+        _shared_job = None
+    if print_progress and bounds:
+        print("")
+    values = []
+    for (start, end), chunk_results in zip(bounds, results):
+        values.extend([None] * (end - start) if chunk_results is None else chunk_results)
+    series = pd.Series(values, index=df.index, dtype=object)
+    series = series.infer_objects()
+    series.attrs['chunks'] = pd.DataFrame(report, columns=['start', 'end', 'time', 'error'])
+    return series
+
+
+def prefetch_map(func, items, np=4, prefetch=16):
+    """
+    Applies the function to the items in the thread pool. Results are yielded in the order of the items and at most
+    'prefetch' results are computed ahead of the consumer, which keeps the memory usage bounded.
+    :param func: function to apply
+    :param items: iterable with 'func' inputs
+    :param np: number of threads
+    :param prefetch: maximal number of results computed ahead of the consumer
+    :return: generator of the 'func' outputs
+    """
+    items = iter(items)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=np)
+    futures = collections.deque()
+    try:
+        futures.extend(executor.submit(func, item) for item in itertools.islice(items, max(prefetch, 1)))
+        while futures:
+            result = futures.popleft().result()
+            futures.extend(executor.submit(func, item) for item in itertools.islice(items, 1))
+            yield result
+    finally:
+        for future in futures:  # Results that were not consumed are not computed (if not started yet)
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def read_gz(fn, as_text=True):
+    """
+    Reads and decompresses the gzipped file
+    :param fn: filename
+    :param as_text: decode the content to str
+    :return: content of the file (str or bytes)
+    """
+    with open(fn, 'rb') as f:
+        data = gzip.decompress(f.read())
+    return data.decode('utf-8') if as_text else data
+
+
 def parse_simple(fn):
     """
     Parses simple txt files containing single PDB id in each line.
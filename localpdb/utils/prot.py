@@ -6,6 +6,22 @@ import numpy as np
 
 nuc_re = re.compile(r'[^ATGCUXNIF.]')
 nonstd_re = re.compile(r'[^X.]')
+std_residues = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def _byte_lut(chars):
+    """
+    Creates the lookup table marking the given characters in the uint8 space
+    """
+    lut = np.zeros(256, dtype=bool)
+    lut[np.frombuffer(chars.encode(), dtype=np.uint8)] = True
+    return lut
+
+
+# Lookup tables equivalent to the 'nuc_re' and 'nonstd_re' regular expressions and the standard residues
+nuc_lut = _byte_lut('ATGCUXNIF.')
+nonstd_lut = _byte_lut('X.')
+std_lut = _byte_lut(std_residues)
 
 
 def parse_pdb_data(entries_fn, entries_type_fn, res_fn, seqres_fn):
@@ -17,6 +33,23 @@ def parse_pdb_data(entries_fn, entries_type_fn, res_fn, seqres_fn):
     @param seqres_fn: filename of the pdb_seqres fasta file
     @return: basic dataframes with per-structure and per-chain information
     """
+    df_struct = parse_pdb_entries(entries_fn, entries_type_fn, res_fn)
+    df_chain = parse_pdb_chains(seqres_fn, df_struct)
+    df_struct = df_struct[df_struct.index.isin(df_chain['pdb'])]  # Keep the order of the index files
+
+    # Return results
+    return df_struct, df_chain
+
+
+def parse_pdb_entries(entries_fn, entries_type_fn, res_fn):
+    """
+    Builds dataframe with the per-structure data parsed from the raw PDB index files
+    @param entries_fn: filename of the entries.idx file
+    @param entries_type_fn:  filename of the pdb_entry_type.txt file
+    @param res_fn: filename of the resolution.idx file
+    @return: dataframe with per-structure information (all protein entries, including the ones without protein
+    chains in the seqres file)
+    """
     switch = os.path.isfile(entries_type_fn) # Switch for maintaining backwards compatibility with 0.1 versions
     if not switch:
         entries_type_fn = entries_fn
@@ -42,26 +75,36 @@ def parse_pdb_data(entries_fn, entries_type_fn, res_fn, seqres_fn):
     df_struct = df_struct[df_struct['type'].isin(['prot', 'prot-nuc'])]
     df_struct = df_struct[df_struct['method'].isin(['diffraction', 'NMR', 'EM'])]
     df_struct['resolution'] = df_struct['resolution'].map(lambda x: x if x > 0 else np.nan)
+    return df_struct
 
+
+def parse_pdb_chains(seqres_fn, df_struct):
+    """
+    Builds dataframe with the per-chain data for the structures in df_struct
+    @param seqres_fn: filename of the pdb_seqres fasta file
+    @param df_struct: dataframe with per-structure information (see parse_pdb_entries)
+    @return: dataframe with per-chain information
+    """
     # Create dataframe with data in a 'per-chain' format
+    # Chains of other entries, nucleic acid chains and chains containing only non-standard residues are skipped
+    # while parsing. Sequences are classified in a vectorized manner, one block of the seqres file at a time.
     pdb_ids = set(df_struct.index.values)
-    id_seq = {entry[0]: (entry[0][0:4], entry[1]) for entry in parse_gz_fasta(seqres_fn) if
-              entry[0][0:4] in pdb_ids}
-    df_chain = pd.DataFrame.from_dict(id_seq, orient='index', columns=['pdb', 'sequence'])
-    if switch:
-        df_chain = pd.merge(df_chain, df_struct[['deposition_date', 'resolution', 'method']], left_on='pdb',
-                            right_index=True)
-    else:
-        df_chain = pd.merge(df_chain, df_struct[['resolution', 'method']], left_on='pdb',
-                            right_index=True)
-
-    # Filter chains with nucleic acids or containing only non-standard residues
-    df_chain = df_chain[~df_chain['sequence'].map(lambda x: is_nucl_seq(x))]
-    df_chain = df_chain[~df_chain['sequence'].map(lambda x: is_nonstd_seq(x))]
-    df_struct = df_struct.loc[list(set(df_chain['pdb'].values.tolist()))]
-
-    # Return results
-    return df_struct, df_chain
+    pdb_chains, seqs, seq_lens, seq_std_fracs = [], [], [], []
+    for block_pdb_chains, block_seqs in parse_gz_fasta_blocks(seqres_fn, ids=pdb_ids):
+        features = classify_sequences(block_seqs)
+        keep = np.flatnonzero(~(features['is_nucl'] | features['is_nonstd']))
+        pdb_chains.extend(block_pdb_chains[i].decode() for i in keep)
+        seqs.extend(block_seqs[i].decode() for i in keep)
+        seq_lens.append(features['length'][keep])
+        seq_std_fracs.append(features['std_fraction'][keep])
+    df_chain = pd.DataFrame({'pdb': [pdb_chain[0:4] for pdb_chain in pdb_chains], 'sequence': seqs,
+                             'seq_len': np.concatenate(seq_lens), 'seq_std_frac': np.concatenate(seq_std_fracs)},
+                            index=pdb_chains)
+    df_chain = df_chain[~df_chain.index.duplicated(keep='last')]
+    df_chain['seq_id'] = pd.util.hash_pandas_object(df_chain['sequence'], index=False).values  # Sequence hash
+    struct_cols = [col for col in ['deposition_date', 'resolution', 'method'] if col in df_struct.columns]
+    df_chain = pd.merge(df_chain, df_struct[struct_cols], left_on='pdb', right_index=True)
+    return df_chain[['pdb', 'sequence', *struct_cols, 'seq_len', 'seq_std_frac', 'seq_id']]
 
 
 def is_nucl_seq(seq):
@@ -85,15 +128,77 @@ def is_nonstd_seq(seq):
     return not bool(res)
 
 
-def parse_gz_fasta(fn):
+def classify_sequences(seqs):
+    """
+    Vectorized counterpart of the is_nucl_seq and is_nonstd_seq functions. Sequences are concatenated into a single
+    uint8 buffer and classified with the byte lookup tables.
+    @param seqs: list of sequences (bytes)
+    @return: dict with numpy arrays: 'is_nucl' and 'is_nonstd' flags, sequence 'length' and 'std_fraction'
+    (fraction of the standard residues)
+    """
+    length = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    bounds = np.concatenate(([0], np.cumsum(length)))
+    buffer = np.frombuffer(b''.join(seqs), dtype=np.uint8)
+
+    def count(lut):
+        # Number of residues of each sequence marked in the lookup table
+        counts = np.concatenate(([0], np.cumsum(lut[buffer], dtype=np.int64)))
+        return counts[bounds[1:]] - counts[bounds[:-1]]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std_fraction = count(std_lut) / length
+    return {'is_nucl': count(~nuc_lut) == 0, 'is_nonstd': count(~nonstd_lut) == 0,
+            'length': length, 'std_fraction': std_fraction}
+
+
+def parse_gz_fasta_blocks(fn, ids=None, block_size=2**24):
+    """
+    Streaming parser for PDB seqres fasta files yielding the records in blocks. Records are not decoded.
+    @param fn: filename with seqres records from the PDB
+    @param ids: PDB ids of the records to keep (default: None - all records are kept)
+    @param block_size: size (in bytes) of the decompressed data processed at once
+    @return: lists of pdb_chain identifiers and sequences (bytes) for each block
+    """
+    if ids is not None:
+        ids = {id_.encode() for id_ in ids}
+    rest = b''
+    with gzip.open(fn, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            lines = (rest + block).split(b'\n')
+            if block:
+                # Carry over the incomplete line and, if needed, the header of the incomplete record
+                rest = lines.pop()
+                if len(lines) % 2 == 1:
+                    rest = lines.pop() + b'\n' + rest
+            elif lines[-1] == b'':
+                lines.pop()
+            pdb_chains, seqs = [], []
+            for header, seq in zip(lines[0::2], lines[1::2]):
+                pdb_chain = header.split(maxsplit=1)[0][1:]
+                if ids is not None and pdb_chain[0:4] not in ids:
+                    continue
+                pdb_chains.append(pdb_chain)
+                seqs.append(seq.rstrip())
+            yield pdb_chains, seqs
+            if not block:
+                break
+
+
+def parse_gz_fasta(fn, ids=None, seq_filters=(), block_size=2**24):
     """
-    Parser for PDB seqres fasta files. Faster than the Bio.SeqIO due to cleaned input format.
+    Streaming parser for PDB seqres fasta files. Faster than the Bio.SeqIO due to cleaned input format.
+    File is decompressed in blocks and filters are applied before the records are decoded, therefore memory usage
+    depends only on the number of kept records and the block size.
     @param fn: filename with seqres records from the PDB
+    @param ids: PDB ids of the records to keep (default: None - all records are kept)
+    @param seq_filters: functions called with the sequence, records for which any of them returns True are skipped
+    @param block_size: size (in bytes) of the decompressed data processed at once
     @return: (pdb_chain, sequence) pairs
     """
-    with gzip.open(fn, 'rt') as f:
-        data = f.readlines()
-        for i in range(0, len(data), 2):
-            pdb_chain = data[i].split()[0][1:]
-            seq = data[i+1].rstrip()
-            yield pdb_chain, seq
+    for pdb_chains, seqs in parse_gz_fasta_blocks(fn, ids=ids, block_size=block_size):
+        for pdb_chain, seq in zip(pdb_chains, seqs):
+            seq = seq.decode()
+            if any(seq_filter(seq) for seq_filter in seq_filters):
+                continue
+            yield pdb_chain.decode(), seq
@@ -118,6 +118,6 @@ class TextCommand(Command):
         return resp[0]
 
     @staticmethod
-    def get_doc():
-        TextService.set_input_params()
+    def get_doc(cache_fn=None, refresh=False):
+        TextService.set_input_params(cache_fn=cache_fn, refresh=refresh)
         return TextService.input_params
@@ -1,4 +1,5 @@
 from .tools.text_api_input_fetcher import read_text_api_input
+from ..cache import MetadataCache
 
 
 class ServiceUtils:
@@ -67,6 +68,7 @@ class TextService:
         self.__input_params = None
 
     @classmethod
-    def set_input_params(cls, source='https://search.rcsb.org/rcsbsearch/v1/metadata/schema'):
-        if cls.input_params is None:
-            cls.input_params = read_text_api_input(source,)
+    def set_input_params(cls, source='https://search.rcsb.org/rcsbsearch/v1/metadata/schema', cache_fn=None,
+                         refresh=False):
+        if cls.input_params is None or refresh:
+            cls.input_params = read_text_api_input(source, cache=MetadataCache(cache_fn, refresh=refresh))
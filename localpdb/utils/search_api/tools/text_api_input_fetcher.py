@@ -1,6 +1,8 @@
 import pandas as pd
 import requests
 
+SCHEMA_TTL = 7 * 24 * 3600  # Expiration time (s) of the cached search API metadata schema
+
 
 def read_netesd(dict_, storage, key=''):
     if dict_['type'] == 'object':
@@ -16,10 +18,23 @@ def read_netesd(dict_, storage, key=''):
         storage.append((key[1:], dict_['type'], dict_.get('description')))
 
 
-def read_text_api_input(source):
+def fetch_text_api_input(source):
     props = []
     data = requests.get(source).json()
     read_netesd(data, props)
+    return props
+
+
+def read_text_api_input(source, cache=None):
+    """
+    @param source: url of the search API metadata schema
+    @param cache: MetadataCache used to store the parsed schema (default: None - schema is always downloaded)
+    @return: pd.DataFrame with the searchable attributes, their types and descriptions
+    """
+    if cache is None:
+        props = fetch_text_api_input(source)
+    else:
+        props = cache.get(f'text_api_input:{source}', lambda: fetch_text_api_input(source), ttl=SCHEMA_TTL)
     data = pd.DataFrame(props, columns=['attribute', 'type', 'description'])
     data = data.set_index('attribute')
     return data
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+
+class EntryChainMap:
+    """
+    Mapping between the rows of the base lpdb.entries and lpdb.chains DataFrames. Each chain row holds the integer
+    code of its entry row and chain rows of each entry are stored in the CSR layout (chain rows of i-th entry are
+    order[indptr[i]:indptr[i + 1]]). Selections are propagated with numpy operations on the row positions instead of
+    the sets of string identifiers.
+    """
+
+    def __init__(self, entry_ids, chain_pdb_ids):
+        """
+        @param entry_ids: index of the base entries DataFrame
+        @param chain_pdb_ids: 'pdb' column of the base chains DataFrame
+        """
+        self.n_entries = len(entry_ids)
+        self.n_chains = len(chain_pdb_ids)
+        self.codes = entry_ids.get_indexer(chain_pdb_ids).astype(np.int32)  # Entry row of each chain row (-1 - none)
+        valid = np.flatnonzero(self.codes >= 0)
+        self.order = valid[np.argsort(self.codes[valid], kind='stable')].astype(np.int32)
+        self.indptr = np.zeros(self.n_entries + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.codes[valid], minlength=self.n_entries), out=self.indptr[1:])
+
+    def chain_rows(self, entry_pos):
+        """
+        @param entry_pos: positions of the entry rows
+        @return: positions of the chain rows belonging to these entries
+        """
+        starts, ends = self.indptr[entry_pos], self.indptr[np.asarray(entry_pos) + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.order[np.arange(lengths.sum(), dtype=np.int64) + offsets]
+
+    def entries_mask(self, chain_pos=None):
+        """
+        @param chain_pos: positions of the selected chain rows (default: None - all chains)
+        @return: boolean mask over the entry rows, True for entries with at least one selected chain
+        """
+        codes = self.codes if chain_pos is None else self.codes[chain_pos]
+        mask = np.zeros(self.n_entries, dtype=bool)
+        mask[codes[codes >= 0]] = True
+        return mask
+
+    def chains_mask(self, entry_pos=None):
+        """
+        @param entry_pos: positions of the selected entry rows (default: None - all entries)
+        @return: boolean mask over the chain rows, True for chains of the selected entries
+        """
+        mask = np.zeros(self.n_chains, dtype=bool)
+        mask[self.order if entry_pos is None else self.chain_rows(entry_pos)] = True
+        return mask
+
+
+class SortedIndex:
+    """
+    Sorted secondary index of a numeric or date column of the base DataFrame. Rows are ordered by the column values
+    (missing values are left out), range queries are answered with the binary search in O(log n + k).
+    """
+
+    def __init__(self, values):
+        """
+        @param values: column of the base DataFrame (pd.Series)
+        """
+        if not (pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_datetime64_any_dtype(values.dtype)) \
+                or pd.api.types.is_bool_dtype(values.dtype):
+            raise ValueError(f'Column \'{values.name}\' is neither numeric nor date column!')
+        valid = np.flatnonzero(values.notna().values)
+        self.order = valid[np.argsort(values.values[valid], kind='stable')]  # Row positions sorted by the values
+        self.values = pd.Index(values.values[self.order])
+
+    def rows(self, lo=None, hi=None):
+        """
+        @param lo: lower bound of the range (inclusive, default: None - no lower bound)
+        @param hi: upper bound of the range (inclusive, default: None - no upper bound)
+        @return: sorted positions of the rows with values within the range
+        """
+        start = 0 if lo is None else self.values.searchsorted(lo, side='left')
+        end = len(self.values) if hi is None else self.values.searchsorted(hi, side='right')
+        return np.sort(self.order[start:end])
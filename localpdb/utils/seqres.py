@@ -0,0 +1,459 @@
+import os
+import mmap
+import numpy as np
+import pandas as pd
+
+
+class SeqresStore:
+    """
+    Sequences of the PDB chains kept in a single buffer with the decompressed seqres data. Each sequence is accessed
+    with the byte offsets, which allows to load the sequences on demand instead of holding them in the DataFrame.
+    """
+
+    def __init__(self, ids, offsets, buffer):
+        """
+        @param ids: pdb_chain identifiers, in the order of the sequences in the buffer
+        @param offsets: array of len(ids) + 1 byte offsets delimiting the sequences in the buffer
+        @param buffer: bytes or mmap object with the concatenated sequences
+        """
+        self.ids = pd.Index(ids)
+        self.offsets = offsets
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_sequences(cls, ids, seqs):
+        """
+        Creates the store from the sequences
+        @param ids: pdb_chain identifiers
+        @param seqs: sequences corresponding to the identifiers
+        @return: SeqresStore
+        """
+        buffer = ''.join(seqs).encode()
+        offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs)), out=offsets[1:])
+        return cls(ids, offsets, buffer)
+
+    @classmethod
+    def load(cls, seq_fn, idx_fn, ids):
+        """
+        Loads the store saved with the save() method. Sequence buffer is memory mapped.
+        @param seq_fn: filename of the sequence buffer
+        @param idx_fn: filename of the offsets index
+        @param ids: pdb_chain identifiers (in the order used when the store was saved)
+        @return: SeqresStore
+        """
+        offsets = np.load(idx_fn)
+        if len(offsets) != len(ids) + 1:
+            raise ValueError(f'Seqres index \'{idx_fn}\' does not match the chain identifiers!')
+        with open(seq_fn, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size > 0 else b''
+        return cls(ids, offsets, buffer)
+
+    def save(self, seq_fn, idx_fn):
+        """
+        Saves the sequence buffer and the offsets index
+        @param seq_fn: filename of the sequence buffer
+        @param idx_fn: filename of the offsets index (numpy .npy format)
+        """
+        with open(seq_fn, 'wb') as f:
+            f.write(self.buffer)
+        with open(idx_fn, 'wb') as f:
+            np.save(f, self.offsets)
+
+    def take(self, ids):
+        """
+        Creates the store with the subset of sequences, the sequences are gathered into the new buffer without decoding
+        @param ids: pdb_chain identifiers
+        @return: SeqresStore with sequences ordered as the ids
+        """
+        ids = pd.Index(ids)
+        positions = self.ids.get_indexer(ids)
+        if (positions == -1).any():
+            missing = ', '.join(ids[positions == -1][:5])
+            raise KeyError(f'Sequences of chains: {missing} are not available!')
+        starts, lengths = self.offsets[positions], np.diff(self.offsets)[positions]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of each byte of the new buffer in the old one
+        residues = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+        buffer = np.frombuffer(self.buffer, dtype=np.uint8)[residues].tobytes() if len(residues) > 0 else b''
+        return SeqresStore(ids, offsets, buffer)
+
+    @classmethod
+    def concat(cls, stores):
+        """
+        Concatenates the stores
+        @param stores: list of SeqresStore objects
+        @return: SeqresStore
+        """
+        offsets, end = [np.zeros(1, dtype=np.int64)], 0
+        for store in stores:  # Empty stores add no offsets, the running end of the buffer is kept separately
+            offsets.append(store.offsets[1:] - store.offsets[0] + end)
+            end += int(store.offsets[-1] - store.offsets[0])
+        buffer = b''.join(bytes(store.buffer[store.offsets[0]:store.offsets[-1]]) for store in stores)
+        return cls(pd.Index([]).append([store.ids for store in stores]), np.concatenate(offsets), buffer)
+
+    def get(self, ids=None):
+        """
+        Fetches the sequences. Sequences are read in the order of the buffer to keep the access sequential.
+        @param ids: pdb_chain identifiers (default: None - all sequences)
+        @return: pd.Series with sequences indexed by the pdb_chain identifiers
+        """
+        if ids is None:
+            ids = self.ids
+            positions = np.arange(len(self.ids))
+        else:
+            ids = pd.Index(ids)
+            positions = self.ids.get_indexer(ids)
+            if (positions == -1).any():
+                missing = ', '.join(ids[positions == -1][:5])
+                raise KeyError(f'Sequences of chains: {missing} are not available!')
+        order = np.argsort(positions, kind='stable')
+        starts, ends = self.offsets[positions[order]].tolist(), self.offsets[positions[order] + 1].tolist()
+        seqs = np.empty(len(positions), dtype=object)
+        seqs[order] = [self.buffer[start:end].decode() for start, end in zip(starts, ends)]
+        return pd.Series(seqs, index=ids, name='sequence')
+
+
+class SequenceArena:
+    """
+    Integer-encoded sequences of the PDB chains kept in a single contiguous uint8 buffer. Residues are encoded with
+    the positions in the ALPHABET, residues outside of the ALPHABET are encoded as 'X'. Sequence of i-th chain spans
+    buffer[offsets[i]:offsets[i + 1]], which allows vectorized operations over all chains (length filters,
+    composition, one-hot encoding) without converting the sequences one at a time.
+    """
+
+    ALPHABET = 'ACDEFGHIKLMNPQRSTVWYX'
+
+    def __init__(self, ids, offsets, buffer, fn=None):
+        """
+        @param ids: pdb_chain identifiers
+        @param offsets: array of len(ids) + 1 offsets delimiting the sequences in the buffer
+        @param buffer: uint8 numpy array (or np.memmap) with the concatenated encoded sequences
+        @param fn: filename of the buffer if it is memory mapped (used to share the buffer between processes)
+        """
+        self.ids = pd.Index(ids)
+        self.offsets = offsets
+        self.buffer = buffer
+        self.fn = fn
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f'SequenceArena holding {len(self)} sequences ({len(self.buffer)} residues)'
+
+    def __getstate__(self):
+        # Memory mapped buffer is re-opened instead of being pickled (e.g. when sent to the worker processes)
+        state = self.__dict__.copy()
+        if self.fn is not None:
+            state['buffer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.fn is not None:
+            self.buffer = np.load(self.fn, mmap_mode='r')
+
+    @classmethod
+    def encoding_lut(cls):
+        """
+        @return: lookup table mapping the bytes (ASCII residues) to the positions in the ALPHABET
+        """
+        lut = np.full(256, cls.ALPHABET.index('X'), dtype=np.uint8)
+        for code, res in enumerate(cls.ALPHABET):
+            lut[ord(res)] = code
+            lut[ord(res.lower())] = code
+        return lut
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Creates the arena by encoding the buffer of the SeqresStore. Offsets of the encoded sequences are the same.
+        @param store: SeqresStore
+        @return: SequenceArena
+        """
+        buffer = cls.encoding_lut()[np.frombuffer(store.buffer, dtype=np.uint8)]
+        return cls(store.ids, store.offsets, buffer)
+
+    @classmethod
+    def load(cls, fn, store):
+        """
+        Loads the arena saved with the save() method, buffer is memory mapped. Arena must be built from the given
+        SeqresStore.
+        @param fn: filename of the encoded buffer (numpy .npy format)
+        @param store: SeqresStore the arena was built from
+        @return: SequenceArena
+        """
+        buffer = np.load(fn, mmap_mode='r')
+        if len(buffer) != store.offsets[-1]:
+            raise ValueError(f'Sequence arena \'{fn}\' does not match the seqres data!')
+        return cls(store.ids, store.offsets, buffer, fn=fn)
+
+    def save(self, fn):
+        """
+        Saves the encoded buffer
+        @param fn: filename of the encoded buffer (numpy .npy format)
+        """
+        with open(fn, 'wb') as f:
+            np.save(f, np.asarray(self.buffer))
+
+    @property
+    def lengths(self):
+        """
+        @return: array with the lengths of the sequences
+        """
+        return np.diff(self.offsets)
+
+    def take(self, ids):
+        """
+        Creates the arena for the subset of sequences. If the ids match the arena the arena itself is returned,
+        otherwise the sequences are gathered into the new contiguous buffer.
+        @param ids: pdb_chain identifiers
+        @return: SequenceArena with sequences ordered as the ids
+        """
+        ids = pd.Index(ids)
+        if ids.equals(self.ids):
+            return self
+        positions = self.ids.get_indexer(ids)
+        if (positions == -1).any():
+            missing = ', '.join(ids[positions == -1][:5])
+            raise KeyError(f'Sequences of chains: {missing} are not available!')
+        starts, lengths = self.offsets[positions], self.lengths[positions]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Position of each residue of the new buffer in the old one
+        residues = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+        return SequenceArena(ids, offsets, np.asarray(self.buffer)[residues])
+
+    def sequence(self, pdb_chain):
+        """
+        @param pdb_chain: pdb_chain identifier
+        @return: encoded sequence (view of the buffer)
+        """
+        i = self.ids.get_loc(pdb_chain)
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def decode(self, pdb_chain):
+        """
+        @param pdb_chain: pdb_chain identifier
+        @return: sequence (str)
+        """
+        return np.frombuffer(self.ALPHABET.encode(), dtype=np.uint8)[self.sequence(pdb_chain)].tobytes().decode()
+
+    def one_hot(self, pdb_chain):
+        """
+        @param pdb_chain: pdb_chain identifier
+        @return: boolean array of shape (sequence length, len(ALPHABET))
+        """
+        return np.eye(len(self.ALPHABET), dtype=bool)[self.sequence(pdb_chain)]
+
+    def composition(self):
+        """
+        Counts the residues of all sequences at once
+        @return: pd.DataFrame with the residue counts, indexed by the pdb_chain identifiers
+        """
+        n, k = len(self), len(self.ALPHABET)
+        seq_idx = np.repeat(np.arange(n, dtype=np.int64), self.lengths)
+        counts = np.bincount(seq_idx * k + np.asarray(self.buffer)[self.offsets[0]:self.offsets[-1]],
+                             minlength=n * k).reshape(n, k)
+        return pd.DataFrame(counts, index=self.ids, columns=list(self.ALPHABET))
+
+
+class KmerIndex:
+    """
+    Inverted index of the k-mers of the PDB chains sequences. K-mers of the standard residues are encoded as the
+    integers (residues are encoded as in the SequenceArena, k-mers with other residues are skipped) and the sorted
+    positions of the sequences containing i-th k-mer are stored in postings[indptr[i]:indptr[i + 1]]. Index is used
+    to select the candidate sequences of the subsequence queries, candidates are verified against the SeqresStore.
+    """
+
+    K = 5
+    N_RESIDUES = len(SequenceArena.ALPHABET) - 1  # Standard residues ('X' is not indexed)
+    CHUNK = 2 ** 22  # Number of residues processed at once when building the index or scanning the sequences
+
+    def __init__(self, store, indptr, postings):
+        """
+        @param store: SeqresStore the index was built from
+        @param indptr: array of N_RESIDUES ** K + 1 offsets delimiting the postings of each k-mer
+        @param postings: positions of the sequences in the store (sorted for each k-mer)
+        """
+        self.store = store
+        self.indptr = indptr
+        self.postings = postings
+
+    def __repr__(self):
+        return f'KmerIndex (k={self.K}) of {len(self.store)} sequences ({len(self.postings)} postings)'
+
+    @classmethod
+    def kmer_codes(cls, encoded):
+        """
+        @param encoded: sequence (or concatenated sequences) encoded as in the SequenceArena
+        @return: integer codes of the k-mers starting at each position of the encoded sequence (-1 for k-mers with
+        non-standard residues)
+        """
+        n = len(encoded) - cls.K + 1
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+        codes = np.zeros(n, dtype=np.int64)
+        unknown = np.zeros(n, dtype=bool)
+        for j in range(cls.K):
+            residues = encoded[j:j + n]
+            codes = codes * cls.N_RESIDUES + residues
+            unknown |= residues >= cls.N_RESIDUES
+        codes[unknown] = -1
+        return codes
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        Builds the index over the sequences of the SeqresStore. Sequences are processed in chunks to limit the memory
+        usage.
+        @param store: SeqresStore
+        @return: KmerIndex
+        """
+        lut = SequenceArena.encoding_lut()
+        buffer = np.frombuffer(store.buffer, dtype=np.uint8) if store.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        n_seqs, kmers, rows = len(store), [], []
+        start = 0
+        while start < n_seqs:
+            end = max(int(np.searchsorted(store.offsets, store.offsets[start] + cls.CHUNK, side='right')) - 1,
+                      start + 1)
+            seq_starts = store.offsets[start:end] - store.offsets[start]
+            lengths = np.diff(store.offsets[start:end + 1])
+            codes = cls.kmer_codes(lut[buffer[store.offsets[start]:store.offsets[end]]])
+            seq_rows = np.repeat(np.arange(start, end, dtype=np.int64), lengths)[:len(codes)]
+            # Skip k-mers with the non-standard residues and the ones spanning two sequences
+            valid = (codes >= 0) & (np.arange(len(codes)) + cls.K <= (seq_starts + lengths)[seq_rows - start])
+            keys = np.unique(codes[valid] * n_seqs + seq_rows[valid])  # Unique (k-mer, sequence) pairs
+            kmers.append((keys // n_seqs).astype(np.int32))
+            rows.append((keys % n_seqs).astype(np.int32))
+            start = end
+        kmers = np.concatenate(kmers) if kmers else np.zeros(0, dtype=np.int32)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        postings = rows[np.argsort(kmers, kind='stable')]  # Chunks are ordered - postings remain sorted
+        indptr = np.zeros(cls.N_RESIDUES ** cls.K + 1, dtype=np.int64)
+        np.cumsum(np.bincount(kmers, minlength=cls.N_RESIDUES ** cls.K), out=indptr[1:])
+        return cls(store, indptr, postings)
+
+    @classmethod
+    def load(cls, fn, idx_fn, store):
+        """
+        Loads the index saved with the save() method, postings are memory mapped. Index must be built from the given
+        SeqresStore.
+        @param fn: filename of the postings (numpy .npy format)
+        @param idx_fn: filename of the k-mer offsets (numpy .npy format)
+        @param store: SeqresStore the index was built from
+        @return: KmerIndex
+        """
+        indptr = np.load(idx_fn)
+        postings = np.load(fn, mmap_mode='r')
+        if len(indptr) != cls.N_RESIDUES ** cls.K + 1 or indptr[-1] != len(postings):
+            raise ValueError(f'K-mer index \'{fn}\' does not match the seqres data!')
+        return cls(store, indptr, postings)
+
+    def save(self, fn, idx_fn):
+        """
+        Saves the postings and the k-mer offsets
+        @param fn: filename of the postings (numpy .npy format)
+        @param idx_fn: filename of the k-mer offsets (numpy .npy format)
+        """
+        with open(fn, 'wb') as f:
+            np.save(f, np.asarray(self.postings))
+        with open(idx_fn, 'wb') as f:
+            np.save(f, self.indptr)
+
+    def candidates(self, codes):
+        """
+        @param codes: codes of the k-mers
+        @return: sorted positions of the sequences containing all k-mers
+        """
+        postings = sorted((self.postings[self.indptr[code]:self.indptr[code + 1]] for code in codes), key=len)
+        rows = np.asarray(postings[0])
+        for other in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def shared_kmers(self, query):
+        """
+        Counts the k-mers of the query present in each sequence
+        @param query: query sequence (str)
+        @return: array with the number of distinct k-mers shared by the query and each sequence of the store
+        """
+        encoded = SequenceArena.encoding_lut()[np.frombuffer(query.upper().encode(), dtype=np.uint8)]
+        codes = np.unique(self.kmer_codes(encoded))
+        codes = codes[codes >= 0]
+        rows = [self.postings[self.indptr[code]:self.indptr[code + 1]] for code in codes]
+        rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype=np.int32)
+        return np.bincount(rows, minlength=len(self.store))
+
+    def find(self, query, max_mismatches=0):
+        """
+        Finds the occurrences of the subsequence. Query is split into max_mismatches + 1 segments - each occurrence
+        matches at least one segment exactly, therefore candidates are the sequences containing all k-mers of any
+        segment. Sequences are scanned if the query is too short to be split into segments holding the k-mers.
+        @param query: subsequence (str)
+        @param max_mismatches: maximal number of mismatches (substitutions) of the occurrence
+        @return: (rows, starts, mismatches) tuple of arrays - positions of the sequences in the store, 0-based start
+        positions of the occurrences in the sequences and number of mismatches
+        """
+        query = np.frombuffer(query.upper().encode(), dtype=np.uint8)
+        encoded = SequenceArena.encoding_lut()[query]
+        n_segments = max_mismatches + 1
+        bounds = np.linspace(0, len(query), n_segments + 1).astype(int)
+        segments = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            codes = self.kmer_codes(encoded[start:end])
+            # Non-overlapping k-mers (and the last one) are enough to select the candidates
+            codes = np.unique(np.concatenate([codes[::self.K], codes[-1:]]))
+            segments.append(codes[codes >= 0])
+        if len(query) == 0 or any(len(codes) == 0 for codes in segments):
+            return self.scan(query, max_mismatches)
+        rows = np.unique(np.concatenate([self.candidates(codes) for codes in segments]))
+        buffer = np.frombuffer(self.store.buffer, dtype=np.uint8)
+        hits = ([], [], [])
+        for row in rows.tolist():
+            seq = buffer[self.store.offsets[row]:self.store.offsets[row + 1]]
+            if len(seq) < len(query):
+                continue
+            mismatches = (np.lib.stride_tricks.sliding_window_view(seq, len(query)) != query).sum(axis=1)
+            starts = np.flatnonzero(mismatches <= max_mismatches)
+            hits[0].append(np.full(len(starts), row, dtype=np.int64))
+            hits[1].append(starts)
+            hits[2].append(mismatches[starts])
+        return self.__concat_hits(hits)
+
+    def scan(self, query, max_mismatches=0):
+        """
+        Finds the occurrences of the subsequence scanning all sequences (see find)
+        @param query: subsequence (uint8 array with the ASCII residues)
+        @param max_mismatches: maximal number of mismatches (substitutions) of the occurrence
+        @return: (rows, starts, mismatches) tuple of arrays
+        """
+        offsets, n = self.store.offsets, len(query)
+        hits = ([], [], [])
+        if n == 0 or offsets[-1] < n:
+            return self.__concat_hits(hits)
+        buffer = np.frombuffer(self.store.buffer, dtype=np.uint8)
+        for start in range(0, offsets[-1] - n + 1, self.CHUNK):
+            end = min(start + self.CHUNK, offsets[-1] - n + 1)  # Window starts [start, end)
+            mismatches = np.zeros(end - start, dtype=np.int32)
+            for j in range(n):
+                mismatches += buffer[start + j:end + j] != query[j]
+            starts = start + np.flatnonzero(mismatches <= max_mismatches)
+            rows = np.searchsorted(offsets, starts, side='right') - 1
+            valid = starts + n <= offsets[rows + 1]  # Skip the windows spanning two sequences
+            hits[0].append(rows[valid])
+            hits[1].append(starts[valid] - offsets[rows[valid]])
+            hits[2].append(mismatches[starts[valid] - start])
+        return self.__concat_hits(hits)
+
+    @staticmethod
+    def __concat_hits(hits):
+        return tuple(np.concatenate(arrays).astype(np.int64) if arrays else np.zeros(0, dtype=np.int64)
+                     for arrays in hits)
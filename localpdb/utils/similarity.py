@@ -0,0 +1,115 @@
+import re
+import math
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+# Karlin-Altschul parameters of the BLOSUM62 matrix with the gap costs used by the aligner (open 11, extend 1)
+LAMBDA = 0.267
+K = 0.041
+GAP_OPEN = -11
+GAP_EXTEND = -1
+
+non_blosum_re = re.compile(r'[^ARNDCQEGHILKMFPSTWYVBZX]')
+
+
+def evalue(score, query_len, db_size):
+    """
+    @param score: raw score of the local alignment
+    @param query_len: length of the query sequence
+    @param db_size: number of residues in the searched sequences
+    @return: expected number of the hits with the same or higher score found by chance
+    """
+    return K * query_len * db_size * math.exp(-LAMBDA * score)
+
+
+def align_chunk(args):
+    """
+    Aligns the query to the candidate sequences (Smith-Waterman, BLOSUM62). Scores are computed first (without the
+    traceback) and only the hits passing the e-value cut-off are aligned. Alignments are not banded (PairwiseAligner
+    has no banded mode), the cost is bounded by aligning only the candidates selected by the k-mer prefilter instead.
+    Inputs are wrapped to the tuple for multiprocessing.
+    @param args: (query, ids, sequences, db_size, max_evalue, min_identity) tuple
+    @return: list of dicts with the alignment statistics of the hits
+    """
+    from Bio.Align import PairwiseAligner, substitution_matrices
+    query, ids, sequences, db_size, max_evalue, min_identity = args
+    aligner = PairwiseAligner(mode='local', substitution_matrix=substitution_matrices.load('BLOSUM62'),
+                              open_gap_score=GAP_OPEN, extend_gap_score=GAP_EXTEND)
+    query = non_blosum_re.sub('X', query.upper())
+    hits = []
+    for pdb_chain, sequence in zip(ids, sequences):
+        sequence = non_blosum_re.sub('X', sequence)
+        score = aligner.score(query, sequence)
+        hit_evalue = evalue(score, len(query), db_size)
+        if hit_evalue > max_evalue:
+            continue
+        query_blocks, subject_blocks = alignment_blocks(aligner.align(query, sequence)[0])
+        stats = alignment_stats(query, sequence, query_blocks, subject_blocks)
+        identity = stats['identities'] / stats['length'] if stats['length'] > 0 else 0
+        if identity < min_identity:
+            continue
+        hits.append({'pdb_chain': pdb_chain, 'sequence_identity': identity, 'evalue': hit_evalue,
+                     'bitscore': (LAMBDA * score - math.log(K)) / math.log(2), 'alignment_length': stats['length'],
+                     'mismatches': stats['mismatches'], 'gaps_opened': stats['gaps_opened'],
+                     'query_beg': query_blocks[0][0] + 1, 'query_end': query_blocks[-1][1],
+                     'subject_beg': subject_blocks[0][0] + 1, 'subject_end': subject_blocks[-1][1]})
+    return hits
+
+
+def alignment_blocks(alignment):
+    """
+    @param alignment: pairwise alignment (Bio.Align.PairwiseAlignment)
+    @return: (query_blocks, subject_blocks) tuple with the lists of (start, end) positions of the gapless blocks
+    """
+    query_blocks, subject_blocks = alignment.aligned
+    return [(int(beg), int(end)) for beg, end in query_blocks], [(int(beg), int(end)) for beg, end in subject_blocks]
+
+
+def alignment_stats(query, subject, query_blocks, subject_blocks):
+    """
+    Computes the alignment statistics from the gapless blocks of the alignment (counted as in BLAST - alignment length
+    includes the gap columns between the blocks)
+    @param query: query sequence
+    @param subject: subject sequence
+    @param query_blocks: list of (start, end) positions of the blocks in the query
+    @param subject_blocks: list of (start, end) positions of the blocks in the subject
+    @return: dict with the 'length', 'identities', 'mismatches' and 'gaps_opened' of the alignment
+    """
+    identities = aligned = gaps = gaps_opened = 0
+    for i, ((query_beg, query_end), (subject_beg, subject_end)) in enumerate(zip(query_blocks, subject_blocks)):
+        identities += sum(a == b for a, b in zip(query[query_beg:query_end], subject[subject_beg:subject_end]))
+        aligned += query_end - query_beg
+        if i > 0:  # Gaps between the consecutive blocks (in the query, subject or both)
+            query_gap, subject_gap = query_beg - query_blocks[i - 1][1], subject_beg - subject_blocks[i - 1][1]
+            gaps += query_gap + subject_gap
+            gaps_opened += (query_gap > 0) + (subject_gap > 0)
+    return {'length': aligned + gaps, 'identities': identities, 'mismatches': aligned - identities,
+            'gaps_opened': gaps_opened}
+
+
+def align_candidates(query, sequences, db_size, max_evalue=1, min_identity=0, np=None, chunk_size=500):
+    """
+    Aligns the query to the candidate sequences. Candidates are split into chunks aligned in parallel by the worker
+    processes.
+    @param query: query sequence
+    @param sequences: pd.Series with candidate sequences indexed by the pdb_chain identifiers
+    @param db_size: number of residues in the searched sequences (used to compute the e-values)
+    @param max_evalue: maximal e-value of the hit
+    @param min_identity: minimal sequence identity (fraction of identical residues in the alignment columns)
+    @param np: number of processes (default: None - number of CPUs, 1 - align in the current process)
+    @param chunk_size: number of sequences aligned by the single job
+    @return: pd.DataFrame with the alignment statistics of the hits (sorted by e-value)
+    """
+    ids, sequences = sequences.index.tolist(), sequences.tolist()
+    chunks = [(query, ids[i:i + chunk_size], sequences[i:i + chunk_size], db_size, max_evalue, min_identity)
+              for i in range(0, len(ids), chunk_size)]
+    if np == 1 or len(chunks) <= 1:
+        results = [align_chunk(chunk) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=np) as executor:
+            results = list(executor.map(align_chunk, chunks))
+    columns = ['pdb_chain', 'sequence_identity', 'evalue', 'bitscore', 'alignment_length', 'mismatches',
+               'gaps_opened', 'query_beg', 'query_end', 'subject_beg', 'subject_end']
+    hits = pd.DataFrame([hit for result in results for hit in result], columns=columns)
+    return hits.sort_values(['evalue', 'pdb_chain'], kind='stable').reset_index(drop=True)
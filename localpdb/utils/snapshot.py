@@ -0,0 +1,242 @@
+import os
+import json
+import pickle
+import logging
+import pandas as pd
+import numpy as np
+from localpdb.utils.prot import parse_pdb_data, parse_pdb_entries, parse_pdb_chains
+from localpdb.utils.seqres import SeqresStore, SequenceArena, KmerIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 5  # Bump whenever the layout of the parsed DataFrames changes to invalidate existing snapshots
+SNAPSHOT_FN = 'pdb_snapshot.pkl'
+SNAPSHOT_INFO_FN = 'pdb_snapshot.json'
+SEQRES_FN = 'pdb_seqres.seq'  # Decompressed sequences of the chains in the snapshot
+SEQRES_IDX_FN = 'pdb_seqres.idx.npy'  # Byte offsets of the sequences in the SEQRES_FN file
+SEQRES_ARENA_FN = 'pdb_seqres.arena.npy'  # Integer-encoded SEQRES_FN file (built on demand)
+SEQRES_KMER_FN = 'pdb_seqres.kmer.npy'  # Postings of the k-mer index of the SEQRES_FN file (built on demand)
+SEQRES_KMER_IDX_FN = 'pdb_seqres.kmer_idx.npy'  # Offsets of the k-mer postings
+DELTA_TYPES = ['added', 'modified', 'obsolete']  # Lists of entries changed in the weekly PDB release
+RAW_FNS = {'entries': 'pdb_entries.txt',
+           'entries_type': 'pdb_entries_type.txt',
+           'resolution': 'pdb_resolution.txt',
+           'seqres': 'pdb_seqres.txt.gz'}
+
+
+def raw_fingerprint(working_path):
+    """
+    Describes the state of the raw PDB files the snapshot is built from
+    @param working_path: directory with the raw PDB files for a given version
+    @return: dict with the snapshot format, pandas version and (size, mtime) of each raw file
+    """
+    files = {}
+    for fn in RAW_FNS.values():
+        try:
+            stat = os.stat(f'{working_path}/{fn}')
+            files[fn] = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            files[fn] = None  # 'pdb_entries_type.txt' is missing in the 0.1 versions
+    return {'format': SNAPSHOT_FORMAT, 'pandas': pd.__version__, 'files': files}
+
+
+def read_snapshot(working_path):
+    """
+    Reads the snapshot of the parsed PDB data if it is present and matches the current raw files
+    @param working_path: directory with the raw PDB files for a given version
+    @return: (entries, chains, seqres) tuple or None if snapshot is missing or outdated. 'chains' DataFrame does not
+    contain the sequences, these are available in the 'seqres' SeqresStore.
+    """
+    try:
+        with open(f'{working_path}/{SNAPSHOT_INFO_FN}') as f:
+            info = json.loads(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+    if info != raw_fingerprint(working_path):
+        logger.debug(f'Snapshot in \'{working_path}\' is outdated.')
+        return None
+    try:
+        entries, chains = pd.read_pickle(f'{working_path}/{SNAPSHOT_FN}')
+        seqres = SeqresStore.load(f'{working_path}/{SEQRES_FN}', f'{working_path}/{SEQRES_IDX_FN}', chains.index)
+    except Exception:
+        logger.debug(f'Snapshot in \'{working_path}\' could not be read.')
+        return None
+    return entries, chains, seqres
+
+
+def write_snapshot(working_path, entries, chains, seqres):
+    """
+    Writes the snapshot of the parsed PDB data. Files are written to temporary names and then renamed so that
+    concurrent readers never see a partially written snapshot.
+    @param working_path: directory with the raw PDB files for a given version
+    @param entries: parsed per-entry DataFrame
+    @param chains: parsed per-chain DataFrame (without the sequences)
+    @param seqres: SeqresStore with the sequences of chains
+    @return: True if snapshot was written, False otherwise (e.g. no write permission in the db_path)
+    """
+    fns = [f'{working_path}/{fn}' for fn in (SEQRES_FN, SEQRES_IDX_FN, SNAPSHOT_FN, SNAPSHOT_INFO_FN)]
+    try:
+        for fn in (SEQRES_ARENA_FN, SEQRES_KMER_FN, SEQRES_KMER_IDX_FN):
+            if os.path.isfile(f'{working_path}/{fn}'):
+                os.remove(f'{working_path}/{fn}')  # Arena and k-mer index of the outdated seqres data
+        seqres.save(f'{fns[0]}.tmp', f'{fns[1]}.tmp')
+        pd.to_pickle((entries, chains), f'{fns[2]}.tmp', protocol=pickle.HIGHEST_PROTOCOL)
+        with open(f'{fns[3]}.tmp', 'w') as f:
+            f.write(json.dumps(raw_fingerprint(working_path)))
+        for fn in fns:
+            os.replace(f'{fn}.tmp', fn)
+    except OSError:
+        logger.debug(f'Could not write snapshot in \'{working_path}\'.')
+        return False
+    logger.debug(f'Written snapshot in \'{working_path}\'.')
+    return True
+
+
+def read_delta_ids(working_path):
+    """
+    Reads the identifiers of the entries added, modified or obsoleted since the previous localpdb version. The
+    '_merged' lists are used if the update spans multiple PDB releases.
+    @param working_path: directory with the raw PDB files for a given version
+    @return: set of the changed pdb ids or None if any of the lists is missing
+    """
+    ids = set()
+    for delta_type in DELTA_TYPES:
+        fn = f'{working_path}/{delta_type}_merged.txt'
+        if not os.path.isfile(fn):
+            fn = f'{working_path}/{delta_type}.txt'
+        try:
+            with open(fn) as f:
+                ids |= {line.strip().lower() for line in f if line.strip()}
+        except FileNotFoundError:
+            return None
+    return ids
+
+
+def update_pdb_data(working_path, prev_working_path, max_changed_frac=0.25):
+    """
+    Builds the parsed PDB data by applying the weekly changes to the snapshot of the previous version. Only the changed
+    entries are parsed from the seqres file. Raw index files of both versions are compared so that the entries which
+    changed but are not listed in the added/modified/obsolete lists are parsed as well.
+    @param working_path: directory with the raw PDB files for a given version
+    @param prev_working_path: directory with the raw PDB files (and the snapshot) of the previous version
+    @param max_changed_frac: fraction of the changed entries above which full parsing is used instead
+    @return: (entries, chains, seqres) tuple or None if the data can not be built incrementally
+    """
+    prev = read_snapshot(prev_working_path)
+    changed = read_delta_ids(working_path)
+    if prev is None or changed is None:
+        return None
+    prev_entries, prev_chains, prev_seqres = prev
+    raw_fns = list(RAW_FNS.values())
+    df_struct = parse_pdb_entries(*[f'{working_path}/{fn}' for fn in raw_fns[:3]])
+    prev_struct = parse_pdb_entries(*[f'{prev_working_path}/{fn}' for fn in raw_fns[:3]])
+    if list(df_struct.columns) != list(prev_struct.columns) or list(prev_entries.columns) != list(df_struct.columns):
+        logger.debug(f'Snapshot in \'{prev_working_path}\' does not match the layout of the raw files.')
+        return None
+
+    # Consistency check - entries with different data in the raw index files are parsed even if they are not listed
+    common = df_struct.index.intersection(prev_struct.index)
+    curr, old = df_struct.loc[common], prev_struct.loc[common]
+    same = ((curr == old) | (curr.isna() & old.isna())).all(axis=1)
+    changed |= set(df_struct.index.difference(prev_struct.index)) | set(common[~same.values])
+    changed = df_struct.index[df_struct.index.isin(list(changed))]
+    if len(changed) > max_changed_frac * len(df_struct):
+        return None
+    logger.debug(f'Building data for \'{working_path}\' incrementally ({len(changed)} changed entries).')
+
+    kept_chains = prev_chains[prev_chains['pdb'].isin(df_struct.index) & ~prev_chains['pdb'].isin(changed)]
+    new_chains = parse_pdb_chains(f'{working_path}/{RAW_FNS["seqres"]}', df_struct.loc[changed])
+    # Order of the full parsing (seqres file order) can be restored only if the seqres files are sorted by pdb ids
+    if not (prev_chains['pdb'].is_monotonic_increasing and new_chains['pdb'].is_monotonic_increasing):
+        logger.debug(f'Seqres files of \'{working_path}\' are not sorted by pdb ids, data will be fully parsed.')
+        return None
+    seqres = SeqresStore.concat([prev_seqres.take(kept_chains.index),
+                                 SeqresStore.from_sequences(new_chains.index, new_chains['sequence'].tolist())])
+    chains = pd.concat([kept_chains, new_chains.drop(columns='sequence')])
+    # Restore the order of the seqres file (sorted by pdb ids) in both chains and sequences
+    order = np.argsort(chains['pdb'].values, kind='stable')
+    chains = chains.iloc[order]
+    seqres = seqres.take(chains.index)
+    entries = df_struct[df_struct.index.isin(chains['pdb'])]
+    return entries, chains, seqres
+
+
+def load_pdb_data(working_path, rebuild=False, lazy_sequences=False, prev_working_path=None):
+    """
+    Loads the parsed PDB data for a given version. Snapshot is used whenever possible, otherwise raw files are parsed
+    and the snapshot is (re)built.
+    @param working_path: directory with the raw PDB files for a given version
+    @param rebuild: force parsing the raw files and rebuilding the snapshot
+    @param lazy_sequences: do not add the 'sequence' column to the chains DataFrame
+    @param prev_working_path: directory with the raw PDB files of the previous version - if set and its snapshot is
+    available the snapshot is built incrementally (see update_pdb_data)
+    @return: basic dataframes with per-structure and per-chain information and SeqresStore with chain sequences
+    """
+    data = None if rebuild else read_snapshot(working_path)
+    if data is None:
+        data = None if prev_working_path is None else update_pdb_data(working_path, prev_working_path)
+        if data is None:
+            entries, chains = parse_pdb_data(*[f'{working_path}/{fn}' for fn in RAW_FNS.values()])
+            seqres = SeqresStore.from_sequences(chains.index, chains['sequence'].tolist())
+            chains = chains.drop(columns='sequence')
+        else:
+            entries, chains, seqres = data
+        if write_snapshot(working_path, entries, chains, seqres):
+            # Switch to the memory mapped buffer
+            seqres = SeqresStore.load(f'{working_path}/{SEQRES_FN}', f'{working_path}/{SEQRES_IDX_FN}', chains.index)
+    else:
+        entries, chains, seqres = data
+    if not lazy_sequences:
+        chains.insert(1, 'sequence', seqres.get().values)
+    return entries, chains, seqres
+
+
+def load_sequence_arena(working_path, seqres, mmap=True):
+    """
+    Loads the integer-encoded sequences. Arena is stored next to the snapshot and memory mapped, it is built on the
+    first use.
+    @param working_path: directory with the raw PDB files for a given version
+    @param seqres: SeqresStore with the sequences of chains
+    @param mmap: memory map the arena from the working_path, otherwise arena is built in memory
+    @return: SequenceArena
+    """
+    arena_fn = f'{working_path}/{SEQRES_ARENA_FN}'
+    if mmap:
+        try:
+            return SequenceArena.load(arena_fn, seqres)
+        except (OSError, ValueError):
+            pass
+    arena = SequenceArena.from_store(seqres)
+    if mmap:
+        try:
+            arena.save(f'{arena_fn}.tmp')
+            os.replace(f'{arena_fn}.tmp', arena_fn)
+            arena = SequenceArena.load(arena_fn, seqres)
+        except OSError:
+            logger.debug(f'Could not write sequence arena in \'{working_path}\'.')
+    return arena
+
+
+def load_kmer_index(working_path, seqres):
+    """
+    Loads the k-mer index of the sequences. Index is stored next to the snapshot (postings are memory mapped), it is
+    built on the first use.
+    @param working_path: directory with the raw PDB files for a given version
+    @param seqres: SeqresStore with the sequences of chains
+    @return: KmerIndex
+    """
+    fn, idx_fn = f'{working_path}/{SEQRES_KMER_FN}', f'{working_path}/{SEQRES_KMER_IDX_FN}'
+    try:
+        return KmerIndex.load(fn, idx_fn, seqres)
+    except (OSError, ValueError):
+        pass
+    logger.debug(f'Building k-mer index in \'{working_path}\'.')
+    index = KmerIndex.from_store(seqres)
+    try:
+        index.save(f'{fn}.tmp', f'{idx_fn}.tmp')
+        os.replace(f'{fn}.tmp', fn)
+        os.replace(f'{idx_fn}.tmp', idx_fn)
+        index = KmerIndex.load(fn, idx_fn, seqres)
+    except OSError:
+        logger.debug(f'Could not write k-mer index in \'{working_path}\'.')
+    return index
@@ -0,0 +1,95 @@
+import json
+import pytest
+from localpdb.utils import cache
+from localpdb.utils.cache import MetadataCache, METADATA_CACHE_FN
+
+
+class Fetcher:
+    """
+    Counts the fetches of the remote value
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'versions': [20210514, 20210521], 'call': self.calls}
+
+
+@pytest.fixture(autouse=True)
+def memo():
+    cache._memo.clear()
+    yield cache._memo
+    cache._memo.clear()
+
+
+class TestMetadataCache:
+    """
+    Test caching of the remote metadata
+    """
+
+    # Test that the value is fetched once per process and persisted in the cache file
+    def test_cache_fetch_once(self, tmp_path):
+        fetch = Fetcher()
+        fn = tmp_path / METADATA_CACHE_FN
+        assert MetadataCache(fn).get('key', fetch, ttl=3600) == {'versions': [20210514, 20210521], 'call': 1}
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 1
+        assert fetch.calls == 1
+        with open(fn) as f:
+            assert json.loads(f.read())['key']['value']['call'] == 1
+
+    # Test that the value cached on disk is used by the next process (in-process memo is empty)
+    def test_cache_persisted(self, tmp_path, memo):
+        fetch = Fetcher()
+        fn = tmp_path / METADATA_CACHE_FN
+        MetadataCache(fn).get('key', fetch, ttl=3600)
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 1
+        assert fetch.calls == 1
+        assert MetadataCache(fn).get('other_key', fetch, ttl=3600)['call'] == 2 # Keys are cached separately
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 1
+
+    # Test that the expired value is fetched again
+    def test_cache_expired(self, tmp_path, memo, monkeypatch):
+        fetch = Fetcher()
+        fn = tmp_path / METADATA_CACHE_FN
+        now = 1621000000.0
+        monkeypatch.setattr(cache.time, 'time', lambda: now)
+        MetadataCache(fn).get('key', fetch, ttl=3600)
+        now += 3599
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 1
+        now += 1
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 2 # Expired both in memo and on disk
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 2
+
+    # Test that refresh ignores the values cached on disk, but the value fetched in this process is reused
+    def test_cache_refresh(self, tmp_path, memo):
+        fetch = Fetcher()
+        fn = tmp_path / METADATA_CACHE_FN
+        MetadataCache(fn).get('key', fetch, ttl=3600)
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 1 # Read from disk...
+        assert MetadataCache(fn, refresh=True).get('key', fetch, ttl=3600)['call'] == 2 # ... and refreshed
+        assert MetadataCache(fn, refresh=True).get('key', fetch, ttl=3600)['call'] == 2
+        assert fetch.calls == 2
+        memo.clear()
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 2 # Refreshed value is persisted
+
+    # Test the cache without the file and with the missing or corrupted file
+    def test_cache_no_file(self, tmp_path, memo):
+        fetch = Fetcher()
+        assert MetadataCache().get('key', fetch, ttl=3600)['call'] == 1
+        assert MetadataCache().get('key', fetch, ttl=3600)['call'] == 1
+        memo.clear()
+        MetadataCache(tmp_path / 'missing_dir' / METADATA_CACHE_FN).get('key', fetch, ttl=3600)
+        assert not (tmp_path / 'missing_dir').exists() # Cache is not written if the directory does not exist
+        memo.clear()
+        fn = tmp_path / METADATA_CACHE_FN
+        fn.write_text('{corrupted')
+        assert MetadataCache(fn).get('key', fetch, ttl=3600)['call'] == 3
+        with open(fn) as f:
+            assert json.loads(f.read())['key']['value']['call'] == 3
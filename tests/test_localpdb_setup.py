@@ -1,18 +1,24 @@
 import yaml
 import os
+import mmap
 import shlex
 import shutil
 import subprocess
 import pytest
 import json
 import tempfile
+import time
 from pathlib import Path
 from localpdb import PDB
+from localpdb.utils.mirror import is_manifest_outdated, load_manifest
+from test_startup import HEAVY_MODULES, run_python
 
 my_path = os.path.dirname(os.path.realpath(__file__))
 with open('{}/test_config.yml'.format(my_path)) as f:
     config = yaml.safe_load(f)
 
+INIT_BUDGET = 10  # Maximal time (s) of the localpdb.PDB construction (with the data snapshot available)
+
 
 @pytest.fixture(scope='class', autouse=True)
 def tmp_path():
@@ -88,6 +94,12 @@ class TestSetupBasic:
     def test_setup_lock_absent(self, tmp_path):
         assert not os.path.isfile(tmp_path / '.lock')
 
+    # Check whether the snapshot of the parsed PDB data was written
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_snapshot(self, tmp_path):
+        assert os.path.isfile(tmp_path / 'data' / '20210514' / 'pdb_snapshot.pkl')
+        assert os.path.isfile(tmp_path / 'data' / '20210514' / 'pdb_snapshot.json')
+
     # Check localpdb.PDB basic behavior
     @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
     def test_setup_lpdb_data(self, tmp_path):
@@ -98,6 +110,9 @@ class TestSetupBasic:
         assert len(lpdb.entries) == 173845 # Check number of entries
         assert len(lpdb.chains) == 591481 # Check number of chains
         assert len(lpdb.entries[lpdb.entries['mmCIF_fn'].notnull()]) == 300 # Check number of synced mmCIF files
+        structures = list(lpdb.iter_structures(format='mmCIF', np=4, prefetch=8)) # Check reading the mmCIF files
+        assert [pdb_id for pdb_id, _ in structures] == lpdb.entries[lpdb.entries['mmCIF_fn'].notnull()].index.tolist()
+        assert all(data.startswith('data_') for _, data in structures)
 
         lpdb.entries = lpdb.entries.loc[['2ftq', '1i00']] # Perform simple selection...
         assert len(lpdb.entries) == 2 # ... and check number of entries
@@ -115,7 +130,181 @@ class TestSetupBasic:
         lpdb.select_updates(mode='a') # Test update selection (added entries)
         assert len(lpdb.entries) == 255
         assert len(lpdb.chains) == 1185
+        lpdb.reset()
+
+        entries = lpdb.entries # Test range selection against the full column scan
+        expected = entries[entries['resolution'] <= 2.0]
+        assert lpdb.select_range('resolution', hi=2.0).equals(expected)
+        expected = entries[entries['deposition_date'].between('2020-01-01', '2020-12-31')]
+        assert lpdb.select_range('deposition_date', '2020-01-01', '2020-12-31').equals(expected)
+        lpdb.select_range('resolution', hi=2.0, select=True)
+        assert len(lpdb.entries) == len(entries[entries['resolution'] <= 2.0])
+        assert set(lpdb.chains['pdb']) == set(lpdb.entries.index)
+        lpdb.reset()
 
+        results = lpdb.map_chains(lambda row: len(row.sequence), columns=['sequence'], np=2, chunksize=10000,
+                                  name='length') # Test parallel map over the chains
+        assert results.equals(lpdb.chains['seq_len'].rename(None))
+        assert (lpdb.chains['length'] == lpdb.chains['seq_len']).all()
+        assert results.attrs['chunks']['error'].isnull().all()
+        lpdb.reset()
+
+        unique = lpdb.unique_sequences() # Test sequence deduplication
+        assert len(unique) == lpdb.chains['sequence'].nunique()
+        assert unique['n_chains'].sum() == len(lpdb.chains)
+        assert (lpdb.chains['seq_id'].map(unique['sequence']) == lpdb.chains['sequence']).all()
+        lpdb.reset()
+
+        sequence = lpdb.chains.loc['2ftq_A', 'sequence'] # Test local subsequence search
+        results = lpdb.find_subsequence(sequence[10:30], no_hits=-1)
+        assert '2ftq_A' in results.index
+        assert (results['score'] == 1).all()
+        expected = lpdb.chains[lpdb.chains['sequence'].str.contains(sequence[10:30], regex=False)]
+        assert set(results.index) == set(expected.index)
+        results = lpdb.find_subsequence(sequence[10:20] + 'W' + sequence[21:30], max_mismatches=1, no_hits=-1)
+        assert '2ftq_A' in results.index
+
+        motifs = ['C-x(2,4)-C-x(3)-[LIVMFYWC]-x(8)-H-x(3,5)-H.', '<M-x-[ST]'] # Test local motif scan
+        results = lpdb.scan_seq_motifs(motifs)
+        assert set(results['motif']) <= set(motifs)
+        expected = lpdb.chains[lpdb.chains['sequence'].str.contains(r'C.{2,4}C.{3}[LIVMFYWC].{8}H.{3,5}H')]
+        assert set(results.loc[results['motif'] == motifs[0], 'pdb_chain']) == set(expected.index)
+        expected = lpdb.chains[lpdb.chains['sequence'].str.match(r'M.[ST]')]
+        assert set(results.loc[results['motif'] == motifs[1], 'pdb_chain']) == set(expected.index)
+
+        results = lpdb.search_seq_local(sequence) # Test local similarity search
+        assert results.index[0] == '2ftq_A' or results.loc['2ftq_A', 'score'] == 1
+        assert all(match['sequence_identity'] >= 0.9 and match['evalue'] <= 1
+                   for matches in results['match_context'] for match in matches)
+
+    # Check the localpdb.PDB construction time (data snapshot is available after setup)
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_init_time(self, tmp_path):
+        start = time.perf_counter()
+        lpdb = PDB(tmp_path)
+        assert time.perf_counter() - start < INIT_BUDGET
+        assert len(lpdb.entries) == 173845
+
+    # Check that the heavy dependencies are not imported by the localpdb.PDB construction
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_init_no_heavy_modules(self, tmp_path):
+        modules = run_python(f'import sys; from localpdb import PDB; PDB("{tmp_path}"); print(" ".join(sys.modules))')
+        assert not any(module in modules for module in HEAVY_MODULES)
+
+    # Check that sequences loaded on demand match the eagerly loaded ones
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_lazy_sequences(self, tmp_path):
+        lpdb = PDB(tmp_path)
+        lpdb_lazy = PDB(tmp_path, lazy_sequences=True)
+        assert 'sequence' not in lpdb_lazy.chains.columns
+        assert isinstance(lpdb_lazy._seqres.buffer, mmap.mmap) # Sequences are memory mapped from the snapshot
+        assert (lpdb_lazy.get_sequences().values == lpdb.chains['sequence'].values).all()
+        assert (lpdb_lazy.get_sequences(['2ftq_A', '1i00_A']).values ==
+                lpdb.chains.loc[['2ftq_A', '1i00_A'], 'sequence'].values).all()
+
+        lpdb_lazy.entries = lpdb_lazy.entries.loc[['2ftq', '1i00']] # Load sequences of the selection...
+        lpdb_lazy.load_sequences()
+        assert (lpdb_lazy.chains['sequence'] == lpdb.chains.loc[lpdb_lazy.chains.index, 'sequence']).all()
+        lpdb_lazy.reset() # ... column is kept on reset, sequences of other chains are loaded on the next call
+        assert lpdb_lazy.chains['sequence'].notnull().sum() == 3
+        lpdb_lazy.load_sequences()
+        assert (lpdb_lazy.chains['sequence'] == lpdb.chains['sequence']).all()
+
+
+    # Check that the selections performed in the batch are propagated as the sequential ones
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_batch(self, tmp_path):
+        lpdb, lpdb_batch = PDB(tmp_path, auto_filter=True), PDB(tmp_path, auto_filter=True)
+        lpdb.entries = lpdb.entries[lpdb.entries['method'] == 'diffraction']
+        lpdb.chains = lpdb.chains[lpdb.chains['seq_len'] > 50]
+        lpdb.entries = lpdb.entries[lpdb.entries['resolution'] <= 2.5]
+        with lpdb_batch.batch():
+            lpdb_batch.entries = lpdb_batch.entries[lpdb_batch.entries['method'] == 'diffraction']
+            with lpdb_batch.batch(): # Nested blocks are propagated on exit of the outermost one
+                lpdb_batch.chains = lpdb_batch.chains[lpdb_batch.chains['seq_len'] > 50]
+            lpdb_batch.entries = lpdb_batch.entries[lpdb_batch.entries['resolution'] <= 2.5]
+        assert lpdb_batch.entries.equals(lpdb.entries)
+        assert lpdb_batch.chains.equals(lpdb.chains)
+
+        lpdb_batch.reset() # Exception raised in the block is not masked and the selection is not propagated
+        with pytest.raises(KeyError):
+            with lpdb_batch.batch():
+                lpdb_batch.entries = lpdb_batch.entries.iloc[:10]
+                lpdb_batch.chains['missing_column']
+        assert len(lpdb_batch.entries) == 10
+        assert len(lpdb_batch.chains) == len(PDB(tmp_path).chains)
+        lpdb_batch.entries = lpdb_batch.entries.iloc[:5] # Auto-filtering works again after the failed block
+        assert set(lpdb_batch.chains['pdb']) == set(lpdb_batch.entries.index)
+
+    # Check that the integer-encoded sequences decode back to lpdb.chains sequences
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_sequence_arena(self, tmp_path):
+        lpdb = PDB(tmp_path)
+        expected = lpdb.chains['sequence'].str.upper().str.replace('[^ACDEFGHIKLMNPQRSTVWY]', 'X', regex=True)
+        arena = lpdb.get_sequence_arena()
+        assert arena.ids.equals(lpdb.chains.index)
+        assert (arena.lengths == lpdb.chains['seq_len'].values).all()
+        assert [arena.decode(pdb_chain) for pdb_chain in arena.ids] == expected.tolist()
+
+        lpdb.entries = lpdb.entries.loc[['2ftq', '1i00']] # Arena of the selection is gathered from the full one
+        for mmap in [True, False]:
+            arena = lpdb.get_sequence_arena(mmap=mmap)
+            assert arena.ids.equals(lpdb.chains.index)
+            assert [arena.decode(pdb_chain) for pdb_chain in arena.ids] == expected[lpdb.chains.index].tolist()
+
+    # Check that the compact memory layout holds the same data as the default one
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_compact(self, tmp_path):
+        lpdb = PDB(tmp_path)
+        lpdb_compact = PDB(tmp_path, compact=True)
+        assert lpdb_compact.chains is lpdb_compact.chains # Joined entry-level columns are cached between the accesses
+        for lpdb_ in [lpdb, lpdb_compact]: # Same selection in both layouts
+            lpdb_.entries = lpdb_.entries[lpdb_.entries['resolution'] <= 2.0]
+            lpdb_.chains = lpdb_.chains[lpdb_.chains['seq_len'] > 50]
+        for name in ['entries', 'chains']:
+            df, df_compact = getattr(lpdb, name), getattr(lpdb_compact, name)
+            assert df.columns.tolist() == df_compact.columns.tolist()
+            assert df.astype(object).equals(df_compact.astype(object))
+        lpdb.reset()
+        lpdb_compact.reset()
+        assert lpdb_compact.chains.astype(object).equals(lpdb.chains.astype(object))
+        usage, usage_compact = lpdb.memory_usage(), lpdb_compact.memory_usage()
+        assert usage_compact['memory'].sum() < usage['memory'].sum()
+        assert usage_compact['memory_default'].sum() == usage['memory'].sum()
+
+    # Check that the modifications of lpdb.entries and lpdb.chains do not persist after reset()
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_reset_restores(self, tmp_path):
+        expected = PDB(tmp_path)
+        for compact in [False, True]:
+            lpdb = PDB(tmp_path, compact=compact)
+            lpdb.entries.loc[lpdb.entries.index[0], 'resolution'] = -1.0
+            lpdb.chains.loc[lpdb.chains.index[0], 'seq_len'] = -1
+            lpdb.reset()
+            assert lpdb.entries.astype(object).equals(expected.entries.astype(object))
+            assert lpdb.chains.astype(object).equals(expected.chains.astype(object))
+
+    # Check that filenames resolved from the mirror manifest match the per-file existence checks
+    @pytest.mark.dependency(depends=['TestSetupBasic::test_setup_run'])
+    def test_setup_mirror_manifest(self, tmp_path):
+        lpdb = PDB(tmp_path)
+        adjusted = lpdb._pdbv.adjust_ids(lpdb.entries.index, version=lpdb.version)
+        for format, fmt in [('pdb', 'pdb/{}/pdb{}.ent.gz'), ('mmCIF', 'mmCIF/{}/{}.cif.gz')]:
+            expected = [f'{tmp_path}/mirror/{fmt.format(pdb_id[1:3], adj_id)}'
+                        if os.path.isfile(f'{tmp_path}/mirror/{fmt.format(pdb_id[1:3], adj_id)}')
+                        else 'not_compatible' if format == 'pdb' and pdb_id in lpdb.bundles else None
+                        for pdb_id, adj_id in adjusted.items()]
+            assert lpdb.entries[f'{format}_fn'].fillna('').tolist() == [fn or '' for fn in expected]
+            assert not is_manifest_outdated(tmp_path, format)
+
+        sub_dir = os.listdir(tmp_path / 'mirror' / 'pdb')[0] # Adding a file marks the manifest as outdated...
+        fn = tmp_path / 'mirror' / 'pdb' / sub_dir / f'pdb0{sub_dir}x.ent.gz'
+        fn.touch()
+        assert is_manifest_outdated(tmp_path, 'pdb')
+        assert f'{sub_dir}/{fn.name}' in load_manifest(tmp_path, 'pdb') # ... and the manifest is rebuilt on load
+        assert not is_manifest_outdated(tmp_path, 'pdb')
+        os.remove(fn)
+        assert f'{sub_dir}/{fn.name}' not in load_manifest(tmp_path, 'pdb')
 
 class TestSetupWrongBaseUrl:
     """
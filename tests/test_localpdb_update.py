@@ -8,6 +8,8 @@ import json
 import tempfile
 from pathlib import Path
 from localpdb import PDB
+from localpdb.utils.prot import parse_pdb_data
+from localpdb.utils.snapshot import RAW_FNS, update_pdb_data
 
 my_path = os.path.dirname(os.path.realpath(__file__))
 with open('{}/test_config.yml'.format(my_path)) as f:
@@ -86,6 +88,36 @@ class TestUpdateBasic:
         lpdb2.entries = lpdb2.entries[lpdb2.entries['biounit'].notnull()]
         assert all(['b20210521' in fn for fn in lpdb1.entries.loc[lpdb2.entries.index]['biounit'].values]) == True
 
+    # Check that the data built incrementally from the previous version matches the fully parsed data
+    @pytest.mark.dependency(depends=['TestUpdateBasic::test_update'])
+    def test_update_incremental(self, tmp_path):
+        working_path, prev_working_path = tmp_path / 'data' / '20210521', tmp_path / 'data' / '20210514'
+        entries, chains, seqres = update_pdb_data(working_path, prev_working_path, max_changed_frac=1)
+        full_entries, full_chains = parse_pdb_data(*[f'{working_path}/{fn}' for fn in RAW_FNS.values()])
+        assert entries.equals(full_entries)
+        assert chains.equals(full_chains.drop(columns='sequence'))
+        assert seqres.ids.equals(full_chains.index)
+        assert (seqres.get().values == full_chains['sequence'].values).all()
+
+    # Check loading of multiple versions against the separately loaded ones
+    @pytest.mark.dependency(depends=['TestUpdateBasic::test_update'])
+    def test_load_versions(self, tmp_path):
+        pdbv = PDB.load_versions(tmp_path)
+        assert pdbv.versions == [20210514, 20210521]
+        seq_ids = set()
+        for version in pdbv.versions:
+            lpdb = PDB(tmp_path, version=version)
+            assert pdbv.entries(version).sort_index().equals(lpdb.entries[pdbv.entries(version).columns].sort_index())
+            chains = pdbv.chains(version)
+            assert chains.sort_index().equals(lpdb.chains[chains.columns].sort_index())
+            assert pdbv.get_sequences(version).sort_index().equals(lpdb.chains['sequence'].sort_index())
+            ids = lpdb.chains.index[::7]
+            assert (pdbv.get_sequences(version, ids).values == lpdb.chains.loc[ids, 'sequence'].values).all()
+            seq_ids.update(lpdb.chains['seq_id'])
+        assert len(pdbv._seqres) == len(seq_ids) # Sequences are stored once for all versions
+        changes = pdbv.compare(20210514, 20210521, level='entries')
+        assert set(changes['removed']).isdisjoint(PDB(tmp_path, version=20210521).entries.index)
+
 
 class TestUpdateSkipVersions:
     """
@@ -0,0 +1,205 @@
+import os
+import time
+import socket
+import threading
+import calendar
+import email.utils
+import http.server
+import pytest
+from localpdb.PDBDownloader import PDBDownloader
+from localpdb.utils.config import load_remote_source
+from localpdb.utils.network import download_url, get_last_modified, get_session
+
+VERSION = 20210514
+
+
+def version_timestamp(version):
+    """
+    @return: timestamp of the noon (UTC) of the PDB version date
+    """
+    return calendar.timegm(time.strptime(f'{version}12', '%Y%m%d%H'))
+
+
+def local_mtime(timestamp):
+    """
+    @return: modification time set by the download ('Last-Modified' date is read as the local time)
+    """
+    return time.mktime(time.gmtime(timestamp))
+
+
+class MirrorHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the files of the mocked PDB mirror (server.files - {path: file dict}) and records the requests
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(body=False)
+
+    def do_GET(self):
+        self.respond(body=True)
+
+    def respond(self, body):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        file = self.server.files.get(self.path)
+        if file is None:
+            self.send_error(404)
+            return
+        if file.get('status') is not None:
+            self.send_error(file['status'])
+            return
+        data, last_modified = file['data'], email.utils.formatdate(file['mtime'], usegmt=True)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None and \
+                email.utils.parsedate_to_datetime(if_modified_since).timestamp() >= int(file['mtime']):
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range') is not None and self.headers.get('If-Range') in (file['etag'], last_modified):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('ETag', file['etag'])
+        self.end_headers()
+        if not body:
+            return
+        if file.get('truncate') is not None: # Connection is dropped after sending the part of the file (once)
+            self.wfile.write(data[start:file.pop('truncate')])
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture()
+def mirror():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MirrorHandler)
+    server.files, server.requests = {}, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    server.add = lambda path, data, mtime=version_timestamp(VERSION), etag='"v1"', **kwargs: \
+        server.files.__setitem__(path, {'data': data, 'mtime': mtime, 'etag': etag, **kwargs})
+    server.count = lambda path, method='GET': sum(1 for req in server.requests if req[:2] == (method, path))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestDownload:
+    """
+    Test the downloads using the local HTTP server
+    """
+
+    # Test the basic download, modification date of the file is replicated
+    def test_download(self, tmp_path, mirror):
+        mirror.add('/file.txt', b'1abc\n2abc\n' * 1000)
+        assert download_url(f'{mirror.url}/file.txt', tmp_path / 'file.txt', partial_dir=tmp_path / '.partial')
+        assert (tmp_path / 'file.txt').read_bytes() == b'1abc\n2abc\n' * 1000
+        assert os.path.getmtime(tmp_path / 'file.txt') == local_mtime(mirror.files['/file.txt']['mtime'])
+        assert os.listdir(tmp_path / '.partial') == []
+
+    # Test that the client errors are not retried
+    def test_download_not_found(self, tmp_path, mirror):
+        assert not download_url(f'{mirror.url}/missing.txt', tmp_path / 'missing.txt', retries=3, backoff=0)
+        assert mirror.count('/missing.txt') == 1
+        assert not os.path.isfile(tmp_path / 'missing.txt')
+
+    # Test that the server errors are retried
+    def test_download_server_error(self, tmp_path, mirror):
+        mirror.add('/file.txt', b'1abc\n', status=503)
+        assert not download_url(f'{mirror.url}/file.txt', tmp_path / 'file.txt', retries=2, backoff=0)
+        assert mirror.count('/file.txt') == 3
+        del mirror.files['/file.txt']['status']
+        assert download_url(f'{mirror.url}/file.txt', tmp_path / 'file.txt', retries=2, backoff=0)
+        assert (tmp_path / 'file.txt').read_bytes() == b'1abc\n'
+
+    # Test the concurrent download of the PDB files (including the weekly lists of the missing versions)
+    def test_download_files(self, tmp_path, mirror):
+        config = load_remote_source('rcsb')
+        config['url'], config['download_proto'] = f'{mirror.url[len("http://"):]}/pub', 'http'
+        for file_type in ['entries', 'resolution', 'bundles']:
+            mirror.add(f'/pub/{config["ftp_locs"][file_type]}', f'{file_type}\n'.encode() * 100)
+        versions = [20210507, VERSION]
+        for version in versions:
+            mirror.add(f'/pub/{config["ftp_locs"]["obsolete"]}/{version}/obsolete.pdb', f'{version}\n'.encode(),
+                       mtime=version_timestamp(version))
+        os.makedirs(tmp_path / 'data' / str(VERSION))
+        pdbd = PDBDownloader(tmp_path, versions, config)
+        results = pdbd.download_files(['entries', 'resolution', 'bundles', 'obsolete', 'entries_type'], np=4,
+                                      retries=1)
+        assert results == {'entries': True, 'resolution': True, 'bundles': True, 'obsolete': True,
+                           'entries_type': False} # Missing file
+        data_path = tmp_path / 'data' / str(VERSION)
+        assert (data_path / 'pdb_entries.txt').read_bytes() == b'entries\n' * 100
+        assert (data_path / 'obsolete.txt').read_bytes() == f'{VERSION}\n'.encode()
+        assert (data_path / 'obsolete_merged.txt').read_bytes() == b'20210507\n20210514\n'
+        assert not any(fn.startswith('tmp_') for fn in os.listdir(data_path))
+        assert mirror.count(f'/pub/{config["ftp_locs"]["entries_type"]}') == 1
+
+    # Test that the existing up to date file is not downloaded again (conditional request, 304 response)
+    def test_download_not_modified(self, tmp_path, mirror):
+        mirror.add('/file.txt', b'1abc\n' * 1000)
+        dest = tmp_path / 'file.txt'
+        assert download_url(f'{mirror.url}/file.txt', dest)
+        stat = os.stat(dest)
+        assert download_url(f'{mirror.url}/file.txt', dest)
+        assert 'If-Modified-Since' in mirror.requests[-1][2]
+        assert os.stat(dest).st_mtime_ns == stat.st_mtime_ns and os.stat(dest).st_ino == stat.st_ino
+        assert dest.read_bytes() == b'1abc\n' * 1000
+
+        mirror.add('/file.txt', b'2abc\n' * 1000, mtime=version_timestamp(VERSION) + 7 * 24 * 3600) # Modified file
+        assert download_url(f'{mirror.url}/file.txt', dest)
+        assert dest.read_bytes() == b'2abc\n' * 1000
+        assert os.path.getmtime(dest) == local_mtime(version_timestamp(VERSION) + 7 * 24 * 3600)
+
+    # Test that the requests share the HTTP session ('Last-Modified' date is read with the HEAD request)
+    def test_download_session(self, tmp_path, mirror):
+        mirror.add('/file.txt', b'1abc\n')
+        assert get_session() is get_session()
+        assert get_last_modified(f'{mirror.url}/file.txt') == local_mtime(version_timestamp(VERSION))
+        assert mirror.count('/file.txt', method='HEAD') == 1
+
+    # Test that the interrupted download is resumed by the retry
+    def test_download_resume_retry(self, tmp_path, mirror):
+        data = os.urandom(300000)
+        mirror.add('/file.bin', data, truncate=100000)
+        assert download_url(f'{mirror.url}/file.bin', tmp_path / 'file.bin', retries=1, backoff=0,
+                            partial_dir=tmp_path / '.partial')
+        assert (tmp_path / 'file.bin').read_bytes() == data
+        offset = int(mirror.requests[-1][2]['Range'][len('bytes='):-1]) # Resumed from the last written chunk
+        assert 0 < offset <= 100000
+        assert os.listdir(tmp_path / '.partial') == []
+
+    # Test that the partial file of the failed download is resumed by the next download
+    def test_download_resume_partial(self, tmp_path, mirror):
+        data = os.urandom(300000)
+        mirror.add('/file.bin', data, truncate=100000)
+        assert not download_url(f'{mirror.url}/file.bin', tmp_path / 'file.bin', partial_dir=tmp_path / '.partial')
+        assert not os.path.isfile(tmp_path / 'file.bin')
+        partial_fn, = [fn for fn in os.listdir(tmp_path / '.partial') if fn.endswith('.partial')]
+        partial = (tmp_path / '.partial' / partial_fn).read_bytes()
+        assert 0 < len(partial) <= 100000 and partial == data[:len(partial)]
+        assert download_url(f'{mirror.url}/file.bin', tmp_path / 'file.bin', partial_dir=tmp_path / '.partial')
+        assert (tmp_path / 'file.bin').read_bytes() == data
+        assert mirror.requests[-1][2]['Range'] == f'bytes={len(partial)}-'
+        assert mirror.requests[-1][2]['If-Range'] == '"v1"'
+        assert os.listdir(tmp_path / '.partial') == []
+
+    # Test that the partial file is discarded if the remote file changed (download restarts from the first byte)
+    def test_download_resume_changed(self, tmp_path, mirror):
+        mirror.add('/file.bin', os.urandom(300000), truncate=100000)
+        assert not download_url(f'{mirror.url}/file.bin', tmp_path / 'file.bin', partial_dir=tmp_path / '.partial')
+        data = os.urandom(200000)
+        mirror.add('/file.bin', data, etag='"v2"')
+        assert download_url(f'{mirror.url}/file.bin', tmp_path / 'file.bin', partial_dir=tmp_path / '.partial')
+        assert (tmp_path / 'file.bin').read_bytes() == data
+        assert mirror.requests[-1][2]['If-Range'] == '"v1"' # Range request was answered with the full file
+        assert os.listdir(tmp_path / '.partial') == []
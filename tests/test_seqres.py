@@ -0,0 +1,41 @@
+import pytest
+from localpdb.utils.seqres import SeqresStore
+
+IDS = ['1abc_A', '1abc_B', '2abc_A', '3abc_A']
+SEQS = ['MKV', 'GSHM', '', 'ACDEFGHIKLMNPQRSTVWY']
+
+
+@pytest.fixture()
+def store():
+    return SeqresStore.from_sequences(IDS, SEQS)
+
+
+class TestSeqresStore:
+    """
+    Test the concatenation of the sequence stores
+    """
+
+    # Test that the concatenated store holds the sequences of all stores
+    def test_concat(self, store):
+        concat = SeqresStore.concat([store.take(IDS[:2]), store.take(IDS[2:])])
+        assert concat.ids.tolist() == IDS
+        assert concat.get().tolist() == SEQS
+        assert concat.offsets.tolist() == store.offsets.tolist()
+        assert len(SeqresStore.concat([store.take([]), store.take([])])) == 0
+
+    # Test the concatenation with the empty stores in the front, in the middle and at the end
+    @pytest.mark.parametrize('empty_pos', [0, 1, 2])
+    def test_concat_empty(self, store, empty_pos):
+        stores = [store.take(IDS[:2]), store.take(IDS[2:])]
+        stores.insert(empty_pos, store.take([]))
+        concat = SeqresStore.concat(stores)
+        assert concat.ids.tolist() == IDS
+        assert concat.get().tolist() == SEQS
+
+    # Test the concatenation of the store slices (offsets not starting at 0)
+    def test_concat_slices(self, store):
+        first = SeqresStore(IDS[1:3], store.offsets[1:4], store.buffer)
+        second = SeqresStore(IDS[3:], store.offsets[3:], store.buffer)
+        concat = SeqresStore.concat([first, second])
+        assert concat.get().tolist() == SEQS[1:]
+        assert concat.offsets[0] == 0 and concat.offsets[-1] == len(concat.buffer)
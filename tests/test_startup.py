@@ -0,0 +1,38 @@
+import sys
+import subprocess
+
+HEAVY_MODULES = ['requests', 'Bio', 'bs4', 'jinja2', 'tqdm']  # Modules imported only by the features that need them
+
+
+def run_python(code):
+    p = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.returncode == 0, p.stderr.decode('utf-8')
+    return p.stdout.decode('utf-8').split()
+
+
+class TestImport:
+    """
+    Test that heavy dependencies are not imported at startup
+    """
+
+    def test_import_no_heavy_modules(self):
+        modules = run_python('import sys, localpdb; print(" ".join(sys.modules))')
+        assert not any(module in modules for module in ['pandas', 'numpy', *HEAVY_MODULES])
+
+    def test_import_pdb_no_heavy_modules(self):
+        modules = run_python('import sys; from localpdb import PDB; print(" ".join(sys.modules))')
+        assert not any(module in modules for module in HEAVY_MODULES)
+
+    def test_import_plugins_no_heavy_modules(self):
+        plugins = ['Biounit', 'DSSP', 'ECOD', 'MasterChain', 'PDBChain', 'PDBClustering', 'PDBSeqresMapper', 'SIFTS',
+                   'Socket']
+        imports = '; '.join(f'import localpdb.plugins.{plugin}' for plugin in plugins)
+        modules = run_python(f'import sys; {imports}; print(" ".join(sys.modules))')
+        assert not any(module in modules for module in HEAVY_MODULES)
+
+    # Test that the classes are imported after the submodule was imported directly
+    def test_import_submodule(self):
+        classes = run_python('import sys, localpdb.PDBDownloader; from localpdb import PDB, PDBVersioneer; '
+                             'print(isinstance(PDB, type), isinstance(PDBVersioneer, type), '
+                             'isinstance(sys.modules["localpdb.PDB"].PDBVersioneer, type))')
+        assert classes == ['True', 'True', 'True']
@@ -0,0 +1,89 @@
+import os
+import json
+import random
+import pytest
+from localpdb.PDBVersioneer import PDBVersioneer, VERSIONING_FN, LEGACY_VERSIONING_FN
+
+VERSIONS = [20210507, 20210514, 20210521, 20210528, 20210604]
+
+
+def adjust_pdb_ids_json(history, id_dict, version, mode='load'):
+    """
+    Resolves the adjusted ids from the JSON versioning log {pdb_id: [versions]} (logic of the earlier localpdb versions)
+    """
+    change_dict = {}
+    for key, h in history.items():
+        vers = [ver for ver in h if ver <= version] if mode == 'setup' else [ver for ver in h if ver > version]
+        if len(vers) > 0 and key in id_dict:
+            change_dict[key] = f'{key}_b{max(vers) if mode == "setup" else min(vers)}'
+    id_dict.update(change_dict)
+    return id_dict, change_dict
+
+
+@pytest.fixture()
+def legacy_history(tmp_path):
+    rng = random.Random(0)
+    pdb_ids = [f'{rng.randint(1, 9)}{rng.choice("abcdefgh")}{rng.choice("abcdefgh")}{rng.randint(0, 9)}'
+               for _ in range(200)]
+    history = {pdb_id: sorted(rng.sample(VERSIONS, rng.randint(1, 3))) for pdb_id in pdb_ids}
+    os.makedirs(tmp_path / 'data')
+    with open(tmp_path / 'data' / LEGACY_VERSIONING_FN, 'w') as f:
+        f.write(json.dumps(history))
+    return history
+
+
+class TestVersioning:
+    """
+    Test the versioning store against the JSON versioning log of the earlier localpdb versions
+    """
+
+    # Test migration of the JSON versioning log
+    def test_migration(self, tmp_path, legacy_history):
+        pdbv = PDBVersioneer(tmp_path)
+        history = pdbv.load_versioning()
+        assert sorted(zip(history['pdb'], history['version'])) == \
+               sorted((pdb_id, version) for pdb_id, versions in legacy_history.items() for version in versions)
+        assert os.path.isfile(tmp_path / 'data' / VERSIONING_FN)
+        with open(tmp_path / 'data' / LEGACY_VERSIONING_FN) as f: # JSON log is kept for the earlier localpdb versions
+            assert json.loads(f.read()) == legacy_history
+        store_mtime = os.stat(tmp_path / 'data' / VERSIONING_FN).st_mtime_ns
+        assert PDBVersioneer(tmp_path).load_versioning().equals(history)
+        assert os.stat(tmp_path / 'data' / VERSIONING_FN).st_mtime_ns == store_mtime # Store is not migrated again
+
+    # Test that the JSON versioning log is kept in sync with the versioning store
+    def test_legacy_sync(self, tmp_path, legacy_history):
+        pdbv = PDBVersioneer(tmp_path)
+        pdbv.append_versioning({'1abc': 20210611, next(iter(legacy_history)): 20210611})
+        with open(tmp_path / 'data' / LEGACY_VERSIONING_FN) as f:
+            legacy = json.loads(f.read())
+        history = pdbv.load_versioning()
+        assert sorted(zip(history['pdb'], history['version'])) == \
+               sorted((pdb_id, version) for pdb_id, versions in legacy.items() for version in versions)
+        assert legacy['1abc'] == [20210611]
+
+        legacy['2xyz'] = [20210618] # Database updated by the earlier localpdb version, store is migrated again
+        with open(tmp_path / 'data' / LEGACY_VERSIONING_FN, 'w') as f:
+            f.write(json.dumps(legacy))
+        mtime = os.stat(tmp_path / 'data' / VERSIONING_FN).st_mtime_ns + 1
+        os.utime(tmp_path / 'data' / LEGACY_VERSIONING_FN, ns=(mtime, mtime))
+        history = PDBVersioneer(tmp_path).load_versioning()
+        assert history[history['pdb'] == '2xyz']['version'].tolist() == [20210618]
+
+    # Test the adjusted ids against the JSON versioning log
+    @pytest.mark.parametrize('mode', ['setup', 'load'])
+    def test_adjust_ids(self, tmp_path, legacy_history, mode):
+        pdbv = PDBVersioneer(tmp_path)
+        pdb_ids = list(legacy_history.keys())[::2] + ['1abc', '2xyz'] # Include the entries without revisions
+        for version in [VERSIONS[0] - 7, *VERSIONS]:
+            expected, expected_changes = adjust_pdb_ids_json(legacy_history, {pdb_id: pdb_id for pdb_id in pdb_ids},
+                                                             version, mode=mode)
+            assert pdbv.adjust_ids(pdb_ids, version, mode=mode).to_dict() == expected
+            assert pdbv.adjust_pdb_ids({pdb_id: pdb_id for pdb_id in pdb_ids}, version, mode=mode) == \
+                   (expected, expected_changes)
+
+        revisions = {pdb_id: 20210611 for pdb_id in pdb_ids[:10]} # Appended revisions are visible in the next lookup
+        pdbv.append_versioning(revisions)
+        for pdb_id, version in revisions.items():
+            legacy_history[pdb_id] = legacy_history.get(pdb_id, []) + [version]
+        expected, _ = adjust_pdb_ids_json(legacy_history, {pdb_id: pdb_id for pdb_id in pdb_ids}, 20210607, mode=mode)
+        assert pdbv.adjust_ids(pdb_ids, 20210607, mode=mode).to_dict() == expected